@@ -5,12 +5,7 @@ from collections import defaultdict
 import logging
 
 # MARK: Logger Initialization
-# Configure logging set-up. We want to log times & types of logs, as well as
-# function names & the subsequent message.
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s'
-)
+# Logging is configured once by the entry point (Client/main.py), so only create this module's logger here.
 logger = logging.getLogger(__name__)
 
 class ChatUI:
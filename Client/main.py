@@ -4,7 +4,7 @@ import grpc
 import threading
 import logging
 import argparse
-import socket # Only for validating IP address inputted.
+import ipaddress
 from datetime import datetime
 # Import our proto materials
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -16,18 +16,54 @@ from UI.chat import ChatUI
 import tkinter as tk
 from tkinter import ttk, messagebox
 from client_config import SERVERS
+from message_batches import group_pending_messages, unbatch
 import time
 
 
 # MARK: Logger Initialization
-# Configure logging set-up. We want to log times & types of logs, as well as
-# function names & the subsequent message.
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Logging is configured here, in the entry point, rather than by the modules it imports.
+def configure_logging():
+    """
+    Log times & types of logs, as well as function names & the subsequent message. Only warnings
+    and errors are logged unless LOGLEVEL (e.g. LOGLEVEL=info) asks for more.
+    """
+    level = os.environ.get('LOGLEVEL', 'WARNING').upper()
+    known = isinstance(logging.getLevelName(level), int)
+    logging.basicConfig(
+        level=level if known else 'WARNING',
+        format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s'
+    )
+    if not known:
+        logger.warning("Unknown LOGLEVEL %r; logging warnings and errors only.", os.environ['LOGLEVEL'])
+
+# check_servers runs before every request and always sends the same heartbeat, so build it once.
+CLIENT_HEARTBEAT = service_pb2.HeartbeatRequest(requestor_id="Client", server_id="")
+
+# Ping the server every 10s, even between requests, and drop the connection if a ping goes unanswered
+# for 5s, so a dead server is noticed even while we are only waiting on the MonitorMessages stream.
+# The servers accept pings at this rate (SERVER_OPTIONS in Server/main.py).
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 10000),
+    ('grpc.keepalive_timeout_ms', 5000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+]
+
+def server_target(host, port):
+    """
+    Build the host:port target gRPC expects for a server, as the servers do for each other (grpc_target
+    in Server/PeerPool.py). IPv6 addresses must be bracketed (e.g. [::1]:5001), otherwise the last
+    colon-separated group is mistaken for the port.
+    """
+    try:
+        if ipaddress.ip_address(host).version == 6:
+            return f'[{host}]:{port}'
+    except ValueError:
+        pass
+    return f'{host}:{port}'
+
 # MARK: Client Class
 class Client:
     """
@@ -43,7 +79,9 @@ class Client:
         # Create a background task for monitoring for new messages from the server.
         self.messageObservation = threading.Thread(target=self._monitor_messages, daemon=True)
 
-        # Handle communication with the servers
+        # Handle communication with the servers. One channel is opened per server address and
+        # reused for every later search, rather than opening a new connection each time.
+        self.channels = {}
         self.current_stub = None
         self.check_servers()
 
@@ -55,20 +93,23 @@ class Client:
             if self.current_stub != None:
                 # If there is no response after 2 seconds, assume the server has died.
                 # Otherwise, no changes are needed.
-                response = self.current_stub.Heartbeat(service_pb2.HeartbeatRequest(requestor_id="Client", server_id=""), timeout=2)
+                response = self.current_stub.Heartbeat(CLIENT_HEARTBEAT, timeout=2)
                 return
             # Otherwise, look for a new server using the servers in the client_config.py file.
             else:
                 self.current_stub = None
                 for server in SERVERS:
                     try:
-                        channel = grpc.insecure_channel(f'{server["ip"]}:{server["port"]}')
+                        address = server_target(server["ip"], server["port"])
+                        channel = self.channels.get(address)
+                        if channel is None:
+                            channel = self.channels[address] = grpc.insecure_channel(address, options=CHANNEL_OPTIONS)
                         stub = service_pb2_grpc.MessageServerStub(channel)
                         # Check if it exists, if there is no response after 2 seconds, move on
-                        stub.Heartbeat(service_pb2.HeartbeatRequest(requestor_id="Client", server_id=""), timeout=2)
+                        stub.Heartbeat(CLIENT_HEARTBEAT, timeout=2)
                         # If we got a valid response, use this server.
                         self.current_stub = stub
-                        logger.info(f"Found server to use with info: {server["ip"]}:{server["port"]}")
+                        logger.info(f"Found server to use with info: {address}")
                         break
                     except Exception as e:
                         # This means that the given server is unavailable.
@@ -224,7 +265,7 @@ class Client:
     def _handle_send_message(self, recipient, message):
         """Sends the server a message request and handles potential failures to deliver the message."""
         try: 
-            logger.info(f"Sending message request to {recipient} with message: {message}")
+            logger.info("Sending message request to %s with message: %s", recipient, message)
             self.check_servers()
             message_request = service_pb2.Message(
                 sender=self.current_user,
@@ -235,7 +276,7 @@ class Client:
             )
             response = self.current_stub.SendMessage(message_request)
             if response.status == service_pb2.MessageResponse.MessageStatus.SUCCESS:
-                logger.info(f"Message sent to {recipient} successfully")
+                logger.info("Message sent to %s successfully", recipient)
             else:
                 logger.error(f"Message failed to send to {recipient}")
 
@@ -260,7 +301,7 @@ class Client:
                     # with the new leader.
                     if original_server != self.current_stub:
                         break
-                    for message in message_iterator:
+                    for message in unbatch(message_iterator):
                         self.chat_ui.display_message(from_user=message.sender, message=message.message)
                 except Exception as e:
                     # If we experience a disconnect or issue, restart the monitoring.
@@ -288,19 +329,8 @@ class Client:
             settings = settings_response.setting
             
             responses = self.current_stub.GetPendingMessage(service_pb2.PendingMessageRequest(username=self.current_user, inbox_limit=settings))
-            pending_messages = {}
-            for response in responses:
-                # If there are no messages yet from this sender, create an empty list to add to.
-                if response.message.sender not in pending_messages:
-                    pending_messages[response.message.sender] = []
-                pending_messages[response.message.sender].append(
-                    {
-                        'sender': response.message.sender,
-                        'message': response.message.message,
-                        'timestamp': response.message.timestamp
-                    }
-                )
-            logger.info(f"Retrieved pending messages: {pending_messages}")
+            pending_messages = group_pending_messages(responses)
+            logger.info("Retrieved pending messages: %s", pending_messages)
             return pending_messages
         
         except Exception as e:
@@ -327,11 +357,10 @@ class Client:
 
 # Validate an IP address
 def validate_ip(value):
+    """Validate an IPv4 or IPv6 address, returning it in its normalized form."""
     try:
-        # Try to convert the value to a valid IP address using socket
-        socket.inet_aton(value)  # This will raise an error if not a valid IPv4 address
-        return value
-    except socket.error:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
         raise argparse.ArgumentTypeError(f"Invalid IP address: {value}")
     
 def parse_arguments():
@@ -357,6 +386,7 @@ def parse_arguments():
 
 # MARK: MAIN
 if __name__ == "__main__":
+    configure_logging()
     # Set up arguments.
     args = parse_arguments()
     port = args.port
@@ -0,0 +1,35 @@
+"""
+Helpers for unpacking the messages the server sends in batches. They are kept apart from the
+UI so the unpacking can be tested without a display.
+"""
+
+def group_pending_messages(responses):
+    """
+    Group a GetPendingMessage stream by sender.
+
+    Parameters:
+        responses (iterable of PendingMessageResponse): Each response carries a batch in messages,
+            or a single message when it was sent without a batch.
+
+    Returns:
+        dict: Maps each sender to a list of {'sender', 'message', 'timestamp'} dicts, in the order received.
+    """
+    pending_messages = {}
+    for response in responses:
+        # Messages arrive in batches; a response without a batch carries a single message.
+        for message in response.messages or [response.message]:
+            # Group by sender, starting an empty list the first time a sender appears.
+            sender = message.sender
+            pending_messages.setdefault(sender, []).append(
+                {
+                    'sender': sender,
+                    'message': message.message,
+                    'timestamp': message.timestamp
+                }
+            )
+    return pending_messages
+
+def unbatch(batches):
+    """Yield every message from a stream of MessageBatch responses, such as MonitorMessages, in order."""
+    for batch in batches:
+        yield from batch.messages
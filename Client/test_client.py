@@ -1,13 +1,27 @@
 import unittest
-from unittest.mock import MagicMock, patch
+from types import SimpleNamespace
+from unittest.mock import MagicMock
 import sys
 import os
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 from proto import service_pb2
-from proto import service_pb2_grpc
+from Client.message_batches import group_pending_messages, unbatch
 from datetime import datetime
 
+# Status values the tests compare responses against.
+REG_OK = service_pb2.RegisterResponse.RegisterStatus.SUCCESS
+LOGIN_OK = service_pb2.LoginResponse.LoginStatus.SUCCESS
+LOGIN_FAIL = service_pb2.LoginResponse.LoginStatus.FAILURE
+USERS_OK = service_pb2.GetUsersResponse.GetUsersStatus.SUCCESS
+PEND_OK = service_pb2.PendingMessageResponse.PendingMessageStatus.SUCCESS
+MSG_OK = service_pb2.MessageResponse.MessageStatus.SUCCESS
+DEL_OK = service_pb2.DeleteAccountResponse.DeleteAccountStatus.SUCCESS
+DEL_FAIL = service_pb2.DeleteAccountResponse.DeleteAccountStatus.FAILURE
+SAVE_OK = service_pb2.SaveSettingsResponse.SaveSettingsStatus.SUCCESS
+SETTINGS_OK = service_pb2.GetSettingsResponse.GetSettingsStatus.SUCCESS
+SETTINGS_FAIL = service_pb2.GetSettingsResponse.GetSettingsStatus.FAILURE
+
 class TestClient(unittest.TestCase):
     def setUp(self):
         class SimpleClient:
@@ -18,7 +32,7 @@ class TestClient(unittest.TestCase):
             
             def _handle_login(self, username, password):
                 response = self.stub.Login(service_pb2.LoginRequest(username=username, password=password))
-                if response.status == service_pb2.LoginResponse.LoginStatus.SUCCESS:
+                if response.status == LOGIN_OK:
                     self.current_user = username
                     return True
                 return False
@@ -29,7 +43,7 @@ class TestClient(unittest.TestCase):
                     password=password, 
                     email=email
                 ))
-                return response.status == service_pb2.RegisterResponse.RegisterStatus.SUCCESS
+                return response.status == REG_OK
             
             def _handle_send_message(self, recipient, message):
                 response = self.stub.SendMessage(service_pb2.Message(
@@ -44,28 +58,17 @@ class TestClient(unittest.TestCase):
                 users = []
                 responses = self.stub.GetUsers(service_pb2.GetUsersRequest(username=self.current_user))
                 for response in responses:
-                    if response.status == service_pb2.GetUsersResponse.GetUsersStatus.SUCCESS:
+                    if response.status == USERS_OK:
                         users.append(response.username)
                 return users
             
             def _handle_get_pending_messages(self):
-                pending_messages = {}
                 responses = self.stub.GetPendingMessage(service_pb2.PendingMessageRequest(username=self.current_user))
-                for response in responses:
-                    if response.status == service_pb2.PendingMessageResponse.PendingMessageStatus.SUCCESS:
-                        sender = response.message.sender
-                        if sender not in pending_messages:
-                            pending_messages[sender] = []
-                        pending_messages[sender].append({
-                            'sender': sender,
-                            'message': response.message.message,
-                            'timestamp': response.message.timestamp
-                        })
-                return pending_messages
+                return group_pending_messages(responses)
             
             def _handle_delete_account(self):
                 response = self.stub.DeleteAccount(service_pb2.DeleteAccountRequest(username=self.current_user))
-                if response.status == service_pb2.DeleteAccountResponse.DeleteAccountStatus.SUCCESS:
+                if response.status == DEL_OK:
                     self.current_user = None
                     self.active = False
                     return True
@@ -76,11 +79,11 @@ class TestClient(unittest.TestCase):
                     username=self.current_user,
                     setting=setting_value
                 ))
-                return response.status == service_pb2.SaveSettingsResponse.SaveSettingsStatus.SUCCESS
+                return response.status == SAVE_OK
             
             def _handle_get_settings(self):
                 response = self.stub.GetSettings(service_pb2.GetSettingsRequest(username=self.current_user))
-                if response.status == service_pb2.GetSettingsResponse.GetSettingsStatus.SUCCESS:
+                if response.status == SETTINGS_OK:
                     return response.setting
                 return 50  # Default value
         
@@ -94,8 +97,7 @@ class TestClient(unittest.TestCase):
     
     def test_login_success(self):
         # Mock the login response
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.LoginResponse.LoginStatus.SUCCESS
+        mock_response = SimpleNamespace(status=LOGIN_OK)
         self.stub.Login.return_value = mock_response
         
         # Call the login method
@@ -112,8 +114,7 @@ class TestClient(unittest.TestCase):
     
     def test_login_failure(self):
         # Mock the login response for failure
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.LoginResponse.LoginStatus.FAILURE
+        mock_response = SimpleNamespace(status=LOGIN_FAIL)
         self.stub.Login.return_value = mock_response
         
         # Call the login method
@@ -129,8 +130,7 @@ class TestClient(unittest.TestCase):
     
     def test_register_success(self):
         # Mock the register response
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.RegisterResponse.RegisterStatus.SUCCESS
+        mock_response = SimpleNamespace(status=REG_OK)
         self.stub.Register.return_value = mock_response
         
         # Call the register method
@@ -150,8 +150,7 @@ class TestClient(unittest.TestCase):
     
     def test_send_message(self):
         # Mock the send message response
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.MessageResponse.MessageStatus.SUCCESS
+        mock_response = SimpleNamespace(status=MSG_OK)
         self.stub.SendMessage.return_value = mock_response
         
         # Call the send message method
@@ -166,13 +165,9 @@ class TestClient(unittest.TestCase):
     
     def test_get_users(self):
         # Mock the GetUsers response
-        mock_response1 = MagicMock()
-        mock_response1.status = service_pb2.GetUsersResponse.GetUsersStatus.SUCCESS
-        mock_response1.username = "user1"
+        mock_response1 = SimpleNamespace(status=USERS_OK, username="user1")
         
-        mock_response2 = MagicMock()
-        mock_response2.status = service_pb2.GetUsersResponse.GetUsersStatus.SUCCESS
-        mock_response2.username = "user2"
+        mock_response2 = SimpleNamespace(status=USERS_OK, username="user2")
         
         self.stub.GetUsers.return_value = [mock_response1, mock_response2]
         
@@ -188,36 +183,18 @@ class TestClient(unittest.TestCase):
         self.assertEqual(users, ["user1", "user2"])
     
     def test_get_pending_messages(self):
-        # Create mock messages
-        message1 = MagicMock()
-        message1.sender = "user1"
-        message1.message = "Hello!"
-        message1.timestamp = "2023-01-0 1 12:00:00"
-        
-        message2 = MagicMock()
-        message2.sender = "user1"
-        message2.message = "How are you?"
-        message2.timestamp = "2023-01-01 12:01:00"
-        
-        message3 = MagicMock()
-        message3.sender = "user2"
-        message3.message = "Hi there!"
-        message3.timestamp = "2023-01-01 12:02:00"
-        
-        # Mock the GetPendingMessage responses
-        mock_response1 = MagicMock()
-        mock_response1.status = service_pb2.PendingMessageResponse.PendingMessageStatus.SUCCESS
-        mock_response1.message = message1
+        # Create messages, each sent in its own response as older servers do
+        message1 = service_pb2.Message(sender="user1", message="Hello!", timestamp="2023-01-01 12:00:00")
         
-        mock_response2 = MagicMock()
-        mock_response2.status = service_pb2.PendingMessageResponse.PendingMessageStatus.SUCCESS
-        mock_response2.message = message2
+        message2 = service_pb2.Message(sender="user1", message="How are you?", timestamp="2023-01-01 12:01:00")
         
-        mock_response3 = MagicMock()
-        mock_response3.status = service_pb2.PendingMessageResponse.PendingMessageStatus.SUCCESS
-        mock_response3.message = message3
+        message3 = service_pb2.Message(sender="user2", message="Hi there!", timestamp="2023-01-01 12:02:00")
         
-        self.stub.GetPendingMessage.return_value = [mock_response1, mock_response2, mock_response3]
+        # Mock the GetPendingMessage responses
+        self.stub.GetPendingMessage.return_value = [
+            service_pb2.PendingMessageResponse(status=PEND_OK, message=message)
+            for message in (message1, message2, message3)
+        ]
         
         # Call the get pending messages method
         pending_messages = self.client._handle_get_pending_messages()
@@ -234,10 +211,59 @@ class TestClient(unittest.TestCase):
         self.assertEqual(pending_messages["user1"][0]["message"], "Hello!")
         self.assertEqual(pending_messages["user2"][0]["message"], "Hi there!")
     
+    def test_get_pending_messages_batched(self):
+        # The server sends several pending messages in each response
+        batch1 = [
+            service_pb2.Message(sender="user1", message="Hello!", timestamp="2023-01-01 12:00:00"),
+            service_pb2.Message(sender="user2", message="Hi there!", timestamp="2023-01-01 12:01:00")
+        ]
+        batch2 = [service_pb2.Message(sender="user1", message="How are you?", timestamp="2023-01-01 12:02:00")]
+        responses = [
+            service_pb2.PendingMessageResponse(status=PEND_OK, messages=batch1),
+            service_pb2.PendingMessageResponse(status=PEND_OK, messages=batch2)
+        ]
+        
+        pending_messages = group_pending_messages(responses)
+        
+        # Every message in every batch is grouped by sender, in the order received
+        self.assertEqual([m["message"] for m in pending_messages["user1"]], ["Hello!", "How are you?"])
+        self.assertEqual(pending_messages["user2"], [
+            {'sender': "user2", 'message': "Hi there!", 'timestamp': "2023-01-01 12:01:00"}
+        ])
+    
+    def test_get_pending_messages_mixed(self):
+        # A stream can mix batched responses with single-message ones
+        responses = [
+            service_pb2.PendingMessageResponse(status=PEND_OK, message=service_pb2.Message(sender="user1", message="First")),
+            service_pb2.PendingMessageResponse(status=PEND_OK, messages=[
+                service_pb2.Message(sender="user1", message="Second"),
+                service_pb2.Message(sender="user2", message="Third")
+            ]),
+            service_pb2.PendingMessageResponse(status=PEND_OK, message=service_pb2.Message(sender="user2", message="Fourth"))
+        ]
+        
+        pending_messages = group_pending_messages(responses)
+        
+        self.assertEqual([m["message"] for m in pending_messages["user1"]], ["First", "Second"])
+        self.assertEqual([m["message"] for m in pending_messages["user2"]], ["Third", "Fourth"])
+    
+    def test_monitor_messages_batches(self):
+        # MonitorMessages streams MessageBatch responses, which may hold one message or several
+        batches = [
+            service_pb2.MessageBatch(messages=[service_pb2.Message(sender="user1", message="Hello!")]),
+            service_pb2.MessageBatch(messages=[
+                service_pb2.Message(sender="user2", message="Hi there!"),
+                service_pb2.Message(sender="user1", message="How are you?")
+            ])
+        ]
+        
+        messages = [(message.sender, message.message) for message in unbatch(iter(batches))]
+        
+        self.assertEqual(messages, [("user1", "Hello!"), ("user2", "Hi there!"), ("user1", "How are you?")])
+    
     def test_delete_account_success(self):
         # Mock the DeleteAccount response
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.DeleteAccountResponse.DeleteAccountStatus.SUCCESS
+        mock_response = SimpleNamespace(status=DEL_OK)
         self.stub.DeleteAccount.return_value = mock_response
         
         # Call the delete account method
@@ -255,8 +281,7 @@ class TestClient(unittest.TestCase):
     
     def test_delete_account_failure(self):
         # Mock the DeleteAccount response for failure
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.DeleteAccountResponse.DeleteAccountStatus.FAILURE
+        mock_response = SimpleNamespace(status=DEL_FAIL)
         self.stub.DeleteAccount.return_value = mock_response
         
         # Call the delete account method
@@ -268,8 +293,7 @@ class TestClient(unittest.TestCase):
     
     def test_save_settings(self):
         # Mock the SaveSettings response
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.SaveSettingsResponse.SaveSettingsStatus.SUCCESS
+        mock_response = SimpleNamespace(status=SAVE_OK)
         self.stub.SaveSettings.return_value = mock_response
         
         # Call the save settings method
@@ -285,9 +309,7 @@ class TestClient(unittest.TestCase):
     
     def test_get_settings(self):
         # Mock the GetSettings response
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.GetSettingsResponse.GetSettingsStatus.SUCCESS
-        mock_response.setting = 75
+        mock_response = SimpleNamespace(status=SETTINGS_OK, setting=75)
         self.stub.GetSettings.return_value = mock_response
         
         # Call the get settings method
@@ -303,8 +325,7 @@ class TestClient(unittest.TestCase):
     
     def test_get_settings_failure(self):
         # Mock the GetSettings response for failure
-        mock_response = MagicMock()
-        mock_response.status = service_pb2.GetSettingsResponse.GetSettingsStatus.FAILURE
+        mock_response = SimpleNamespace(status=SETTINGS_FAIL)
         self.stub.GetSettings.return_value = mock_response
         
         # Call the get settings method
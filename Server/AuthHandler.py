@@ -1,29 +1,60 @@
+import os
 import sqlite3
 import hashlib
-from datetime import datetime
+import hmac
+import time
+from ConnectionPool import ConnectionPool
+
+# Number of read-write connections kept by each AuthHandler. The users table is only touched on
+# register and login, and passwords are hashed before a connection is borrowed, so a couple is enough.
+AUTH_POOL_SIZE = 2
 
 class AuthHandler:
     """
     The AuthHandler class contains helpful functionalities to manage the authentication
     of new and existing users.
     """
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, pool_size=AUTH_POOL_SIZE):
         self.db_name = f"{ip}_{port}.db"
+        self.pool = ConnectionPool(self.db_name, pool_size)
+        # Let SQL compare a candidate hash against the stored one, so recording a login is a single statement.
+        self.pool.create_function("digest_matches", 2, hmac.compare_digest)
+
+    def close(self):
+        """Close the connections held by this handler."""
+        self.pool.close()
+
+    # Number of PBKDF2 iterations used when hashing passwords.
+    HASH_ITERATIONS = 100_000
+
+    @staticmethod
+    def hash_password(password, salt):
+        """
+        Hash password using PBKDF2-HMAC-SHA256 with the given salt. Returns the raw 32-byte digest.
+        hashlib hands the whole derivation to OpenSSL and releases the GIL while it runs, so logins
+        on different gRPC worker threads hash in parallel.
+        """
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, AuthHandler.HASH_ITERATIONS)
 
     @staticmethod
-    def hash_password(password):
-        """Hash password using SHA-256."""
-        return hashlib.sha256(password.encode()).hexdigest()
-    
+    def password_digest(password, salt):
+        """Hash password the same way as the stored hash for a user with the given salt."""
+        if salt is None:
+            # Accounts created before salting was introduced store an unsalted, hex-encoded SHA-256 hash.
+            return hashlib.sha256(password.encode()).hexdigest()
+        return AuthHandler.hash_password(password, salt)
+
     def register_user(self, username, password, email):
         """Register a new user."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
+            # Hash before borrowing a connection, so slow hashes do not hold up other logins.
+            salt = os.urandom(16)
+            password_hash = self.hash_password(password, salt)
+            with self.pool.connection() as conn:
                 cursor = conn.cursor()
-                password_hash = self.hash_password(password)
                 cursor.execute(
-                    'INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)',
-                    (username, password_hash, email)
+                    'INSERT INTO users (username, password_hash, email, salt) VALUES (?, ?, ?, ?)',
+                    (username, password_hash, email, salt)
                 )
                 conn.commit()
                 return True, "Success"
@@ -35,17 +66,20 @@ class AuthHandler:
     def authenticate_user(self, username, password):
         """Authenticate user login."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT password_hash FROM users WHERE username = ?', (username,))
-                result = cursor.fetchone()
-                
-                if result and result[0] == self.hash_password(password):
-                    cursor.execute(
-                        'UPDATE users SET last_login = ? WHERE username = ?',
-                        (datetime.now(), username)
-                    )
-                    conn.commit()
+            with self.pool.connection() as conn:
+                row = conn.execute_cached('SELECT salt FROM users WHERE username = ?', (username,)).fetchone()
+            if row is None:
+                return False, "Invalid username or password"
+            # Hash the password before the UPDATE so the slow PBKDF2 step happens outside the write
+            # transaction, and with no connection borrowed; otherwise other logins wait on it.
+            password_hash = self.password_digest(password, row[0])
+            with self.pool.connection() as conn:
+                # Check the hash and record the login in one statement; a row only comes back if the password matched.
+                cursor = conn.execute_cached(
+                    'UPDATE users SET last_login = ? WHERE username = ? AND digest_matches(password_hash, ?) RETURNING 1',
+                    (int(time.time() * 1000), username, password_hash)
+                )
+                if cursor.fetchone():
                     return True, "Success"
                 return False, "Invalid username or password"
         except Exception as e:
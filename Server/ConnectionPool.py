@@ -0,0 +1,93 @@
+import sqlite3
+import queue
+from contextlib import contextmanager
+
+# Applied to every connection when it is opened. WAL lets readers proceed while a write is in
+# progress, and with synchronous=NORMAL a commit no longer waits on an fsync of the database file.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+# Prepared statements kept per connection (sqlite3 defaults to 128).
+STATEMENT_CACHE_SIZE = 256
+
+class PooledConnection(sqlite3.Connection):
+    """
+    A SQLite connection that keeps one cursor per SQL statement, so the hot queries reuse the same
+    cursor (and its prepared statement) on every call instead of creating and discarding a cursor each time.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursors = {}
+
+    def cursor_for(self, sql):
+        """Return the cursor kept for this SQL statement, creating it on first use."""
+        cursor = self.cursors.get(sql)
+        if cursor is None:
+            cursor = self.cursors[sql] = self.cursor()
+        return cursor
+
+    def execute_cached(self, sql, parameters=()):
+        """Execute a statement on its kept cursor. Fetch the results before running the same SQL again."""
+        return self.cursor_for(sql).execute(sql, parameters)
+
+class ConnectionPool:
+    """
+    The ConnectionPool class keeps a fixed set of open SQLite connections to a database,
+    so that each request can borrow an existing connection instead of opening the database
+    file again. The pool is sized to the number of database calls expected to run at once.
+
+    A read_only pool opens its connections with mode=ro. Under WAL those readers never take the
+    write lock, so they can serve queries while a writer from another pool is committing.
+    """
+    def __init__(self, db_name, size=10, read_only=False):
+        self.db_name = db_name
+        self.read_only = read_only
+        self.connections = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self.connections.put(self.open_connection())
+
+    def open_connection(self):
+        """Open a new connection to the database with our PRAGMA settings applied."""
+        # Connections are shared between the gRPC worker threads, but only one thread
+        # uses a connection at a time since it must be borrowed from the pool. Each connection
+        # keeps its prepared statements cached, so repeated queries skip SQLite's parser and planner.
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE, factory=PooledConnection)
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE,
+                                   factory=PooledConnection)
+        for pragma in PRAGMAS:
+            # The journal mode is a property of the database file, so only a writer can change it.
+            if self.read_only and pragma.startswith("PRAGMA journal_mode"):
+                continue
+            conn.execute(pragma)
+        return conn
+
+    def create_function(self, name, num_params, func):
+        """Register a Python function for use in SQL on every connection in the pool."""
+        for conn in self.connections.queue:
+            conn.create_function(name, num_params, func, deterministic=True)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a with block. Like sqlite3's own context manager,
+        the transaction is committed if the block succeeds and rolled back if it raises.
+        """
+        conn = self.connections.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.connections.put(conn)
+
+    def close(self):
+        """Close every connection in the pool."""
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
@@ -1,39 +1,97 @@
 import sqlite3
 import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from operator import itemgetter
+from ConnectionPool import ConnectionPool
 
 # MARK: Initialize Logger
-# Configure logging set-up. We want to log times & types of logs, as well as
-# function names & the subsequent message.
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s'
-)
-
-# Create a logger
+# Logging is configured once by the entry point (main.py), so only create this module's logger here.
 logger = logging.getLogger(__name__)
 
+# MARK: Timestamps
+# Timestamps are stored as integer Unix epoch milliseconds, so they compare and sort as
+# numbers in the indexes. Clients send and receive them as datetime strings.
+def to_epoch_ms(timestamp):
+    """Convert a client timestamp (e.g. str(datetime.now())) to epoch milliseconds, defaulting to now."""
+    if isinstance(timestamp, int):
+        return timestamp
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return int(time.time() * 1000)
+
+def format_epoch_ms(epoch_ms):
+    """Convert stored epoch milliseconds back to the datetime string clients expect."""
+    return str(datetime.fromtimestamp(epoch_ms / 1000))
+
+# Converts a datetime string stored by older versions to epoch milliseconds in SQL.
+# Those strings are local time, like datetime.fromtimestamp above.
+TEXT_TO_EPOCH_MS = "CAST(ROUND((julianday({0}, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
+
+# MARK: Message History Queries
+# SQLite rarely uses two indexes for an OR, so query each side with its own index.
+# Messages a user sent to themselves are only taken from the first branch.
+HISTORY = '''
+    SELECT sender, recipient, message, timestamp FROM messages WHERE sender = ? AND isPending = 0
+    UNION ALL
+    SELECT sender, recipient, message, timestamp FROM messages WHERE recipient = ? AND sender != ? AND isPending = 0
+'''
+HISTORY_ALL = f'{HISTORY} ORDER BY timestamp ASC'
+# Walk both indexes newest first and stop after limit rows, then put them back in order.
+HISTORY_RECENT = f'SELECT * FROM ({HISTORY} ORDER BY timestamp DESC LIMIT ?) ORDER BY timestamp ASC'
+
+# Number of read-write connections kept by each DatabaseManager.
+WRITE_POOL_SIZE = 2
+
+# Number of users whose settings are kept in memory; the least recently used are dropped first.
+SETTINGS_CACHE_SIZE = 10_000
+
 class DatabaseManager:
     """
     The DatabaseManager class contains helpful functionalities to manage the database of users
     and creation and updating of messages.
     """
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, pool_size=10):
         self.db_name = f"{ip}_{port}.db"
+        # SQLite allows one writer at a time, so a couple of write connections is enough. Every
+        # worker gets a read-only connection, since reads never wait on each other under WAL.
+        # The write pool is opened first so that it creates the database file and enables WAL.
+        self.write_pool = ConnectionPool(self.db_name, WRITE_POOL_SIZE)
+        self.read_pool = ConnectionPool(self.db_name, pool_size, read_only=True)
+        # Settings are read on every message operation but rarely change, so keep them in memory.
+        # Entries are dropped whenever a user's settings are saved or their account is deleted, and the
+        # generation counts those drops so a read that started before one does not cache a stale value.
+        self.settings_cache = OrderedDict()
+        self.settings_lock = threading.Lock()
+        self.settings_generation = 0
         
+    def close(self):
+        """Close the connections held by this manager."""
+        self.write_pool.close()
+        self.read_pool.close()
+
     def setup_databases(self, ip, port):
         """Initialize the SQLite database."""
-        with sqlite3.connect(self.db_name) as conn:
+        with self.write_pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
                     username TEXT PRIMARY KEY,
-                    password_hash TEXT NOT NULL,
+                    password_hash BLOB NOT NULL,
                     email TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP,
-                    settings INTEGER DEFAULT 50
+                    last_login INTEGER,
+                    settings INTEGER DEFAULT 50,
+                    salt BLOB
                 )
             ''')
+            # Databases created before passwords were salted are missing the salt column.
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(users)')]
+            if 'salt' not in columns:
+                cursor.execute('ALTER TABLE users ADD COLUMN salt BLOB')
             # Create a table to store messages between users
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS messages (
@@ -42,29 +100,35 @@ class DatabaseManager:
                     recipient TEXT NOT NULL,
                     message TEXT NOT NULL,
                     timestamp INTEGER NOT NULL,
-                    isPending BOOL NOT NULL
+                    isPending INTEGER NOT NULL
                 )
             ''')
+            # Older databases stored timestamps as datetime strings; convert them in place.
+            cursor.execute(f"UPDATE messages SET timestamp = {TEXT_TO_EPOCH_MS.format('timestamp')} WHERE typeof(timestamp) = 'text'")
+            cursor.execute(f"UPDATE users SET last_login = {TEXT_TO_EPOCH_MS.format('last_login')} WHERE typeof(last_login) = 'text'")
+            # Index the message lookups so they return rows already ordered by timestamp
+            # instead of scanning and sorting the whole table.
+            # Pending and delivered rows get separate partial indexes, so the pending lookup
+            # only touches the (typically few) undelivered messages.
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending ON messages(recipient, timestamp) WHERE isPending = 1')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_delivered_sender ON messages(sender, timestamp) WHERE isPending = 0')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_delivered_recipient ON messages(recipient, timestamp) WHERE isPending = 0')
 
     # MARK: User Functionalities
     def get_contacts(self):
-        """Register a new user."""
+        """Retrieve every registered username, or None if the query failed."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT username FROM users')
-                results = cursor.fetchall()
-                usernames = []
-                for row in results:
-                    usernames.append(row[0])
-                return usernames
+            with self.read_pool.connection() as conn:
+                # Pull the username out of every row in C rather than looping in Python.
+                return list(map(itemgetter(0), conn.execute_cached('SELECT username FROM users')))
         except Exception as e:
-            return f"Fetching contacts failed: {str(e)}"
+            logger.error(f"Fetching contacts failed: {str(e)}")
+            return None
 
     def delete_account(self, username):
         """Remove the given username from the table to delete an account."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
+            with self.write_pool.connection() as conn:
                 cursor = conn.cursor()
                 
                 # Start a transaction
@@ -78,6 +142,7 @@ class DatabaseManager:
                     
                     # Commit the transaction
                     conn.commit()
+                    self.forget_settings(username)
                     logger.info(f"Successfully deleted account for user: {username}")
                     return True
                     
@@ -94,72 +159,119 @@ class DatabaseManager:
             return False
 
     def get_settings(self, username):
-        """Retrieve a user's setting for the limit of notifications from the table."""
+        """Retrieve a user's setting for the limit of notifications, from memory if we have already read it."""
+        with self.settings_lock:
+            if username in self.settings_cache:
+                self.settings_cache.move_to_end(username)
+                return self.settings_cache[username]
+            generation = self.settings_generation
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT settings FROM users WHERE username = ?', (username,))
-                result = cursor.fetchone()[0]
-                return result
+            with self.read_pool.connection() as conn:
+                result = conn.execute_cached('SELECT settings FROM users WHERE username = ?', (username,)).fetchone()[0]
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
             return False
+        with self.settings_lock:
+            # Only cache the value if no settings were saved while we were reading it.
+            if generation == self.settings_generation:
+                self.settings_cache[username] = result
+                if len(self.settings_cache) > SETTINGS_CACHE_SIZE:
+                    self.settings_cache.popitem(last=False)
+        return result
 
     def save_settings(self, username, settings):
         """Save the user's settings in the database or update the existing value."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('UPDATE users SET settings = ? WHERE username = ?', (settings, username))
-                conn.commit()
-                return True
+            with self.write_pool.connection() as conn:
+                conn.execute_cached('UPDATE users SET settings = ? WHERE username = ?', (settings, username))
+            # Drop rather than overwrite, in case the username did not exist.
+            self.forget_settings(username)
+            return True
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
             return False
 
+    def forget_settings(self, username):
+        """Drop a user's cached settings once a change to them has been committed."""
+        with self.settings_lock:
+            self.settings_generation += 1
+            self.settings_cache.pop(username, None)
+
     # MARK: Persistent Messages 
     def save_message(self, sender, recipient, message, timestamp, isPending):
         """Store a message in the table with appropriate values. Denote if the message is currently pending delivery."""
+        self.save_messages([(sender, recipient, message, timestamp, isPending)])
+
+    def save_messages(self, rows):
+        """
+        Store several messages in a single transaction, so a burst of messages pays for one commit
+        instead of one per message.
+
+        Parameters:
+            rows (list): Tuples of (sender, recipient, message, timestamp, isPending).
+
+        Returns:
+            bool: True if every message was saved, False otherwise.
+        """
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    'INSERT INTO messages (sender, recipient, message, timestamp, isPending) VALUES (?, ?, ?, ?, ?)',
-                    (sender, recipient, message, timestamp, isPending)
+            with self.write_pool.connection() as conn:
+                # Take the write lock up front rather than upgrading part way through the batch.
+                conn.execute('BEGIN IMMEDIATE')
+                insert = 'INSERT INTO messages (sender, recipient, message, timestamp, isPending) VALUES (?, ?, ?, ?, ?)'
+                conn.cursor_for(insert).executemany(
+                    insert,
+                    [(sender, recipient, message, to_epoch_ms(timestamp), int(isPending)) for sender, recipient, message, timestamp, isPending in rows]
                 )
-                conn.commit()
+            return True
         except Exception as e:
-            logger.error(f"Unexpected error while saving message: {str(e)}")
+            logger.error(f"Unexpected error while saving messages: {str(e)}")
+            return False
 
-    def pending_message_sent(self, id):
-        """Updates a pending message when it has been delivered."""
+    def pending_messages_sent(self, ids):
+        """Mark several pending messages as delivered in a single transaction."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('UPDATE messages SET isPending = ? WHERE id = ?', (False, id))
-                conn.commit()
+            with self.write_pool.connection() as conn:
+                update = 'UPDATE messages SET isPending = 0 WHERE id = ?'
+                conn.cursor_for(update).executemany(update, [(id,) for id in ids])
         except Exception as e:
             logger.error(f"Unexpected error while updating message status: {str(e)}")
 
-    def get_pending_messages(self, username):
-        """Retrieve all messages that are pending for a given user."""
+    def get_pending_messages(self, username, limit=-1):
+        """
+        Retrieve the messages that are pending for a given user, oldest first, as
+        (id, sender, recipient, message, timestamp) tuples.
+
+        Parameters:
+            username (str): The recipient of the pending messages.
+            limit (int): The maximum number of messages to return; a negative limit returns them all.
+        """
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM messages WHERE recipient = ? AND isPending = True ORDER BY timestamp ASC', (username,))
-                pending_messages = cursor.fetchall()
+            with self.read_pool.connection() as conn:
+                pending_messages = conn.execute_cached(
+                    'SELECT id, sender, recipient, message, timestamp FROM messages WHERE recipient = ? AND isPending = 1 ORDER BY timestamp ASC LIMIT ?',
+                    (username, limit)
+                ).fetchall()
                 return pending_messages
         except Exception as e:
             logger.error(f"Unexpected error fetching pending messages for user: {str(e)}")
             return []
 
-    def get_messages(self, username):
+    def get_messages(self, username, limit=0):
+        """
+        Retrieve delivered messages sent or received by a given user, oldest first, as
+        (sender, recipient, message, timestamp) tuples. Plain tuples are cheaper to build than
+        sqlite3.Row objects, and callers unpack them straight into Message protos.
+
+        Parameters:
+            username (str): The user whose conversations to fetch.
+            limit (int): Only return the most recent limit messages; 0 returns them all.
+        """
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                conn.row_factory = sqlite3.Row # We want the rows as dictionaries, not tuples.
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM messages WHERE isPending = False AND (sender = ? OR recipient = ?) ORDER BY timestamp ASC', (username, username))
+            with self.read_pool.connection() as conn:
+                if limit > 0:
+                    cursor = conn.execute_cached(HISTORY_RECENT, (username, username, username, limit))
+                else:
+                    cursor = conn.execute_cached(HISTORY_ALL, (username, username, username))
                 all_messages = cursor.fetchall()
                 return all_messages
         except Exception as e:
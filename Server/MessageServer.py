@@ -3,6 +3,8 @@ import os
 import grpc
 import uuid
 import threading
+import queue
+import time
 from datetime import datetime, timedelta
 import logging
 from collections import defaultdict
@@ -11,20 +13,58 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from proto import service_pb2
 from proto import service_pb2_grpc
 from AuthHandler import AuthHandler
-from DatabaseManager import DatabaseManager
+from DatabaseManager import DatabaseManager, format_epoch_ms
+from PeerPool import PeerPool, grpc_target
 
 
 # MARK: Initialize Logger
-# Configure logging set-up. We want to log times & types of logs, as well as
-# function names & the subsequent message.
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s'
-)
-
-# Create a logger
+# Logging is configured once by the entry point (main.py), so only create this module's logger here.
 logger = logging.getLogger(__name__)
 
+# MARK: Response Constants
+# Bind the status enums we return on every RPC once, rather than walking the
+# service_pb2 attribute chain in each handler.
+_REG_OK = service_pb2.RegisterResponse.RegisterStatus.SUCCESS
+_REG_FAIL = service_pb2.RegisterResponse.RegisterStatus.FAILURE
+_LOGIN_OK = service_pb2.LoginResponse.LoginStatus.SUCCESS
+_LOGIN_FAIL = service_pb2.LoginResponse.LoginStatus.FAILURE
+_USERS_OK = service_pb2.GetUsersResponse.GetUsersStatus.SUCCESS
+_USERS_FAIL = service_pb2.GetUsersResponse.GetUsersStatus.FAILURE
+_PEND_OK = service_pb2.PendingMessageResponse.PendingMessageStatus.SUCCESS
+_PEND_FAIL = service_pb2.PendingMessageResponse.PendingMessageStatus.FAILURE
+_SEND_OK = service_pb2.MessageResponse.MessageStatus.SUCCESS
+_SEND_FAIL = service_pb2.MessageResponse.MessageStatus.FAILURE
+_DELETE_OK = service_pb2.DeleteAccountResponse.DeleteAccountStatus.SUCCESS
+_DELETE_FAIL = service_pb2.DeleteAccountResponse.DeleteAccountStatus.FAILURE
+_SAVE_OK = service_pb2.SaveSettingsResponse.SaveSettingsStatus.SUCCESS
+_SAVE_FAIL = service_pb2.SaveSettingsResponse.SaveSettingsStatus.FAILURE
+_SETTINGS_OK = service_pb2.GetSettingsResponse.GetSettingsStatus.SUCCESS
+_SETTINGS_FAIL = service_pb2.GetSettingsResponse.GetSettingsStatus.FAILURE
+
+# Responses that carry nothing but a status are built once and shared between calls. gRPC only
+# reads them to serialize the reply, and no handler modifies them after returning.
+_SEND_OK_RESPONSE = service_pb2.MessageResponse(status=_SEND_OK)
+_SEND_FAIL_RESPONSE = service_pb2.MessageResponse(status=_SEND_FAIL)
+_DELETE_OK_RESPONSE = service_pb2.DeleteAccountResponse(status=_DELETE_OK)
+_DELETE_FAIL_RESPONSE = service_pb2.DeleteAccountResponse(status=_DELETE_FAIL)
+_SAVE_OK_RESPONSE = service_pb2.SaveSettingsResponse(status=_SAVE_OK)
+_SAVE_FAIL_RESPONSE = service_pb2.SaveSettingsResponse(status=_SAVE_FAIL)
+
+# Maximum number of messages sent in each PendingMessageResponse.
+PENDING_BATCH_SIZE = 32
+
+# Maximum number of queued messages MonitorMessages sends in one MessageBatch.
+MONITOR_BATCH_SIZE = 32
+
+# Maximum number of messages held in memory for one user's MonitorMessages stream. When a
+# stream falls this far behind, further messages are stored as pending instead, so a slow or
+# stuck client cannot grow the server's memory without bound.
+MAX_QUEUED_MESSAGES = 10_000
+
+# How long (in seconds) GetUsers may serve the cached list of usernames. Register and DeleteAccount
+# invalidate it straight away, so this only bounds staleness from changes made some other way.
+CONTACTS_TTL = 10
+
 # MARK: MessageServer 
 class MessageServer(service_pb2_grpc.MessageServerServicer):
     """
@@ -38,10 +78,12 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
     When a leader disappears, a new leader is elected based on which replica has the lowest UUID value.
     """
         
-    def __init__(self, ip, port, ip_connect=None, port_connect=None):
-        # Set up the independant database of the server.
-        self.db_manager = DatabaseManager(ip, port)
-        self.auth_manager = AuthHandler(ip, port)
+    def __init__(self, ip, port, ip_connect=None, port_connect=None, pool_size=10, db_manager=None, auth_manager=None):
+        # Set up the independant database of the server. The database manager keeps a read pool of pool_size
+        # open connections, which every RPC borrows from; the auth handler only needs a couple for register and
+        # login. Already-built managers can be passed in instead.
+        self.db_manager = db_manager or DatabaseManager(ip, port, pool_size)
+        self.auth_manager = auth_manager or AuthHandler(ip, port)
         self.db_manager.setup_databases(ip, port)
 
         # Define server information, including its unique identifier.
@@ -49,21 +91,34 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
         self.port = str(port)
         self.server_id = str(uuid.uuid4())
         self.active_clients = {}
-        self.message_queue = defaultdict(list)
+        # Queues are only created for users who open a MonitorMessages stream (see user_queue), so
+        # requests naming unknown users cannot grow this dictionary.
+        self.message_queue = {}
+        # Guards creating a user's message queue and removing a stale client stream. Both are
+        # quick dictionary updates, and queue.Queue does its own locking for puts and gets.
+        self.clients_lock = threading.Lock()
         logger.info(f"Server created with UUID: {self.server_id}")
 
+        # Cache the list of usernames served by GetUsers; see contacts().
+        self.contacts_cache = ()
+        self.contacts_expiry = 0.0
+        self.contacts_lock = threading.Lock()
+
         # Store information about the other servers in the chat application.
         self.servers = {}  
         self.leader = defaultdict(dict)
+        # Bumped whenever our list of servers changes; piggybacked on heartbeats so peers
+        # can tell whether the roster changes we send them are new.
+        self.roster_version = 0
+        # Count consecutive failed heartbeats to our successor in the heartbeat ring.
+        self.ring_failures = 0
         # Keep a thread that will constantly send and monitor heartbeats from the other servers.
         self.heartbeatThread = threading.Thread(target=self._heartbeat, daemon=True)
 
         # If we are the leader, define the appropriate information for the leader.
         if not ip_connect and not port_connect:
             logger.info("This process is currently the leader.")
-            channel = grpc.insecure_channel(f'{ip}:{port}')
-            stub = service_pb2_grpc.MessageServerStub(channel)
-            self.leader["stub"] = stub
+            self.leader["stub"] = PeerPool(ip, port)
             self.leader["id"] = self.server_id
             self.leader["ip"] = ip
             self.leader["port"] = port
@@ -98,7 +153,7 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             style as the failure of a registration. It will contain the error message instead.
         """
         try:
-            logger.info(f"Handling register request from {request.username}")
+            logger.info("Handling register request from %s", request.username)
             
             # If we are not the leader and the request is from a client, forward the request to the leader.
             if request.source == "Client" and self.leader["id"] != self.server_id:
@@ -112,27 +167,21 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             if request.source == "Client" and self.leader["id"] == self.server_id:
                 logger.info("Propagating register request from leader to replicas.")
                 new_request = service_pb2.RegisterRequest(username=request.username, password=request.password, email=request.email, source="Leader")
-                for id in self.servers:
+                for id in list(self.servers):
                     self.servers[id]["stub"].Register(new_request)
 
             if status:
-                logger.info(f"Successfully registered username {request.username}")
-                status_message = service_pb2.RegisterResponse.RegisterStatus.SUCCESS
-                return service_pb2.RegisterResponse(
-                    status=status_message, 
-                    message=message)
+                self.invalidate_contacts()
+                logger.info("Successfully registered username %s", request.username)
+                return service_pb2.RegisterResponse(status=_REG_OK, message=message)
             else:
-                logger.warning(f"Registration failed for username {request.username} with message: {message}")
-                return service_pb2.RegisterResponse(
-                    status=status, 
-                    message=message)
+                logger.warning("Registration failed for username %s with message: %s", request.username, message)
+                # register_user reports failure as False, which is 0 and would serialize as SUCCESS; send the enum.
+                return service_pb2.RegisterResponse(status=_REG_FAIL, message=message)
         
         except Exception as e:
-            logger.error(f"Failed to register user {request.username} with error: {e}")
-            status = service_pb2.RegisterResponse.RegisterStatus.FAILURE
-            return service_pb2.RegisterResponse(
-                status=status, 
-                message="User registration failed.")
+            logger.error("Failed to register user %s with error: %s", request.username, e)
+            return service_pb2.RegisterResponse(status=_REG_FAIL, message="User registration failed.")
 
     def Login(self, request: service_pb2.LoginRequest, context) -> service_pb2.LoginResponse:
         """
@@ -156,7 +205,7 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             If an error occurs during login, a failure response is returned to the client with the specific error message.
         """
         try:
-            logger.info(f"Handling login request from {request.username}")
+            logger.info("Handling login request from %s", request.username)
             # If we are not the leader and the request is from a client, forward the request to the leader.
             if request.source == "Client" and self.leader["id"] != self.server_id:
                 logger.info("Forwarding login request from replica to leader.")
@@ -168,28 +217,19 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             if request.source == "Client" and self.leader["id"] == self.server_id:
                 logger.info("Propagating login request from leader to replicas.")
                 new_request = service_pb2.LoginRequest(username=request.username, password=request.password, source="Leader")
-                for id in self.servers:
+                for id in list(self.servers):
                     self.servers[id]["stub"].Login(new_request)
 
             if response:
-                logger.info(f"Successfully logged in user with username {request.username}")
-                status_message = service_pb2.LoginResponse.LoginStatus.SUCCESS
-                return service_pb2.LoginResponse(
-                    status=status_message, 
-                    message=message)
+                logger.info("Successfully logged in user with username %s", request.username)
+                return service_pb2.LoginResponse(status=_LOGIN_OK, message=message)
             else:
-                logger.warning(f"Login failed for username {request.username} with message: {message}")
-                status = service_pb2.LoginResponse.LoginStatus.FAILURE
-                return service_pb2.LoginResponse(
-                    status=status, 
-                    message=message)
+                logger.warning("Login failed for username %s with message: %s", request.username, message)
+                return service_pb2.LoginResponse(status=_LOGIN_FAIL, message=message)
         
         except Exception as e:
-            logger.error(f"Failed to login user {request.username} with error: {e}")
-            status_message = service_pb2.LoginResponse.LoginStatus.FAILURE
-            return service_pb2.LoginResponse(
-                status=status_message, 
-                message="User login failed.")
+            logger.error("Failed to login user %s with error: %s", request.username, e)
+            return service_pb2.LoginResponse(status=_LOGIN_FAIL, message="User login failed.")
 
     # MARK: Set-Up Services
     def GetUsers(self, request : service_pb2.GetUsersRequest, context) -> service_pb2.GetUsersResponse:
@@ -210,18 +250,18 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             If an error occurs during the process of retrieving users, a failure response is sent with an empty username.
         """
         try:
-            logger.info(f"Handling get_users request from {request.username}")
-            users = self.db_manager.get_contacts()
-            logger.info(f"Retrieved users from database to send to client via a stream: {users}")
+            logger.info("Handling get_users request from %s", request.username)
+            users = self.contacts()
+            logger.info("Retrieved users from database to send to client via a stream: %s", users)
             for user in users:
                 yield service_pb2.GetUsersResponse(
-                    status=service_pb2.GetUsersResponse.GetUsersStatus.SUCCESS,
+                    status=_USERS_OK,
                     username=user
                 )
         except Exception as e:
-            logger.error(f"Failed to retrieve stream of users from database with error: {e}")
+            logger.error("Failed to retrieve stream of users from database with error: %s", e)
             yield service_pb2.GetUsersResponse(
-                status=service_pb2.GetUsersResponse.GetUsersStatus.FAILURE,
+                status=_USERS_FAIL,
                 username=""
             )
 
@@ -247,7 +287,7 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             If an error occurs while retrieving or streaming pending messages, a failure response is sent to the client with an error message.
         """
         try:
-            logger.info(f"Handling request from {request.username} to retrieve pending messages.")
+            logger.info("Handling request from %s to retrieve pending messages.", request.username)
             
             # If we are not the leader and the request is from a client, forward the request to the leader.
             if request.source == "Client" and self.leader["id"] != self.server_id:
@@ -256,39 +296,43 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
                 return self.leader["stub"].GetPendingMessage(request)
             
             # Only send the number of messages that the user desires.
-            counter = 0
-            pending_messages = self.db_manager.get_pending_messages(request.username)
-            logger.info(f"Messages pending for {request.username}: {pending_messages}")
+            pending_messages = self.db_manager.get_pending_messages(request.username, max(request.inbox_limit, 0))
+            logger.info("Messages pending for %s: %s", request.username, pending_messages)
 
             # If we are the leader, propagate the request to all replicas to maintain consistency.
             if request.source == "Client" and self.leader["id"] == self.server_id:
                 logger.info("Propagating GetPendingMessage request from leader to replicas.")
-                new_request = service_pb2.GetPendingMessage(username=request.username, inbox_limit=request.inbox_limit, source="Leader")
-                for id in self.servers:
+                new_request = service_pb2.PendingMessageRequest(username=request.username, inbox_limit=request.inbox_limit, source="Leader")
+                for id in list(self.servers):
                     self.servers[id]["stub"].GetPendingMessage(new_request)
 
-            while len(pending_messages) > 0 and counter < request.inbox_limit:
-                counter += 1
-                pending_message = pending_messages.pop(0)
-                # Update persistent storage status of message.
-                self.db_manager.pending_message_sent(pending_message["id"])
-                serialized_message = service_pb2.Message(sender=pending_message["sender"], 
-                                                recipient=pending_message["recipient"], 
-                                                message=pending_message["message"], 
-                                                timestamp=pending_message["timestamp"])
+            # Most calls find nothing waiting, so finish without opening a write transaction.
+            if not pending_messages:
+                return
+
+            # Send the messages in batches, so a user with many pending messages gets a few large stream
+            # frames instead of one small frame per message.
+            for start in range(0, len(pending_messages), PENDING_BATCH_SIZE):
+                batch = pending_messages[start:start + PENDING_BATCH_SIZE]
+                # Mark each batch as delivered in one transaction just before sending it, so if the client
+                # disconnects part way through, the batches it never received stay pending.
+                self.db_manager.pending_messages_sent([pending_message[0] for pending_message in batch])
                 yield service_pb2.PendingMessageResponse(
-                    status=service_pb2.PendingMessageResponse.PendingMessageStatus.SUCCESS,
-                    message=serialized_message
+                    status=_PEND_OK,
+                    messages=[
+                        service_pb2.Message(sender=sender, recipient=recipient, message=message, timestamp=format_epoch_ms(timestamp))
+                        for message_id, sender, recipient, message, timestamp in batch
+                    ]
                 )
 
         except Exception as e:
-            logger.error(f"Failed to stream pending messages to {request.username} with error: {e}")
+            logger.error("Failed to stream pending messages to %s with error: %s", request.username, e)
             error_message = service_pb2.Message(sender="error", 
                                                 recipient="error", 
                                                 message=str(e), 
                                                 timestamp=str(datetime.now()))
             yield service_pb2.PendingMessageResponse(
-                status=service_pb2.PendingMessageResponse.PendingMessageStatus.FAILURE,
+                status=_PEND_FAIL,
                 message=error_message
             )
 
@@ -299,6 +343,7 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
         Parameters:
             request (MessageHistoryRequest): Contains the request info for retrieving all stored messages.
                 - username (str): The user who is requesting messages.
+                - limit (int): Only stream the most recent limit messages; 0 streams the whole history.
             context (RPCContext): The RPC call context, containing information about the client.
 
         Yields (streams):
@@ -308,19 +353,18 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             If an error occurs while retrieving or streaming messages, a failure response is sent to the client with an error message.
         """
         try:
-            logger.info(f"Retrieving message history for user: {request.username}")
+            logger.info("Retrieving message history for user: %s", request.username)
             # Messages are already ordered by timestamp for conversations. 
             # Serialize the messages and yield them individually to the stream.
-            messages = self.db_manager.get_messages(request.username)
-            print("HERE:", messages)
-            for message in messages:
-                serialized_message = service_pb2.Message(sender=message["sender"], 
-                                                recipient=message["recipient"], 
-                                                message=message["message"], 
-                                                timestamp=message["timestamp"])
+            messages = self.db_manager.get_messages(request.username, request.limit)
+            for sender, recipient, message, timestamp in messages:
+                serialized_message = service_pb2.Message(sender=sender, 
+                                                recipient=recipient, 
+                                                message=message, 
+                                                timestamp=format_epoch_ms(timestamp))
                 yield serialized_message
         except Exception as e:
-            logger.error(f"Failed to retrieve message history for user {request.username} with error: {e}")
+            logger.error("Failed to retrieve message history for user %s with error: %s", request.username, e)
             error_message = service_pb2.Message(sender="error", 
                                                 recipient="error", 
                                                 message=str(e), 
@@ -351,51 +395,53 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             - If an error occurs during the message sending process, a FAILURE message is sent to the client.
         """
         try:
-            logger.info(f"Handling request to send a message from {request.sender} to {request.recipient} for message: {request.message}")
+            logger.info("Handling request to send a message from %s to %s for message: %s", request.sender, request.recipient, request.message)
             
             # If we are not the leader and the request is from a client, forward the request to the leader.
             if request.source == "Client" and self.leader["id"] != self.server_id:
                 logger.info("Forwarding SendMessage request from replica to leader.")
                 return self.leader["stub"].SendMessage(request)
 
-            message_request = service_pb2.Message(
-                    sender=request.sender,
-                    recipient=request.recipient,
-                    message=request.message,
-                    timestamp=request.timestamp
-                )
+            # The request is already a Message, so stream it to the recipient as is rather than copying it field by field.
+            message_request = request
             
             #  If the leader is handling this request, forward it to all of the replicas.
             if request.source == "Client" and self.leader["id"] == self.server_id:
                 logger.info("Propagating SendMessage request from leader to replicas.")
                 new_request = service_pb2.Message(sender=request.sender, recipient=request.recipient, message=request.message, timestamp=request.timestamp, source="Leader")
-                for id in self.servers:
+                for id in list(self.servers):
                     self.servers[id]["stub"].SendMessage(new_request)
 
             # If the other client is currently online, send the message instantly.
-            if request.recipient in self.active_clients.keys():
-                logger.info(f"The recipient {request.recipient} is active, now confirming they have a valid streaming connection.")
+            client_stream = self.active_clients.get(request.recipient)
+            if client_stream is not None:
+                logger.info("The recipient %s is active, now confirming they have a valid streaming connection.", request.recipient)
                 
                 # Verify that the connection is still active, or treat this like our pending messages.
-                if not self.active_clients[request.recipient].is_active():
-                    logger.info(f"The recipient {request.recipient} has become inactive. Removing them from active clients list.")
+                if not client_stream.is_active():
+                    logger.info("The recipient %s has become inactive. Removing them from active clients list.", request.recipient)
                     # Remove the disconnected client from the active list.
-                    self.active_clients.pop(request.recipient)
+                    # Only remove the stream we checked; the client may have reconnected in the meantime.
+                    with self.clients_lock:
+                        if self.active_clients.get(request.recipient) is client_stream:
+                            del self.active_clients[request.recipient]
                 else:
-                    logger.info(f"Message from {request.sender} added to queue for streaming to {request.recipient}.")
-                    self.message_queue[request.recipient].append(message_request)
-                    # Save to persistent storage
-                    self.db_manager.save_message(request.sender, request.recipient, request.message, request.timestamp, False)
-                    return service_pb2.MessageResponse(
-                        status=service_pb2.MessageResponse.MessageStatus.SUCCESS
-                    )
+                    try:
+                        self.user_queue(request.recipient).put_nowait(message_request)
+                    except queue.Full:
+                        logger.warning("The queue for %s is full; storing the message from %s as pending.", request.recipient, request.sender)
+                    else:
+                        logger.info("Message from %s added to queue for streaming to %s.", request.sender, request.recipient)
+                        # Save to persistent storage
+                        self.db_manager.save_message(request.sender, request.recipient, request.message, request.timestamp, False)
+                        return _SEND_OK_RESPONSE
             # If the client is not active and reachable, add the message to the pending message in our database.
             self.db_manager.save_message(request.sender, request.recipient, request.message, request.timestamp, True)
-            return service_pb2.MessageResponse(status=service_pb2.MessageResponse.MessageStatus.SUCCESS)
+            return _SEND_OK_RESPONSE
 
         except Exception as e:
-            logger.error(f"Failed to send message from {request.sender} to {request.recipient} with error: {e}")
-            return service_pb2.MessageResponse(status=service_pb2.MessageResponse.MessageStatus.FAILURE)
+            logger.error("Failed to send message from %s to %s with error: %s", request.sender, request.recipient, e)
+            return _SEND_FAIL_RESPONSE
 
     def MonitorMessages(self, request : service_pb2.MonitorMessagesRequest, context):
         """
@@ -411,16 +457,17 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             context (RPCContext): The RPC call context, containing information about the client.
 
         Yields (stream):
-            Message: The message that is to be delivered from a different client to the client who called this service.
+            MessageBatch: The messages that are to be delivered from other clients to the client who called this service.
+                A single waiting message is sent straight away; messages that queued up together are sent together.
         """
         try:
-            logger.info(f"Handling client {request.username}'s request to monitor for messages.")
+            logger.info("Handling client %s's request to monitor for messages.", request.username)
 
             # If we are not the leader and the request is from a client, forward the request to the leader.
             if request.source == "Client" and self.leader["id"] != self.server_id:
                 # Before we forward, let's make sure the leader hasn't died!
                 try:
-                    self.leader["stub"].Heartbeat(service_pb2.HeartbeatRequest(requestor_id=self.server_id, server_id=self.leader["id"]), timeout=1)
+                    self.leader["stub"].Heartbeat(service_pb2.HeartbeatRequest(requestor_id="Client", server_id=self.leader["id"]), timeout=1)
                     logger.info("Forwarding MonitorMessages request from replica to leader.")
                     return self.leader["stub"].MonitorMessages(request)
                 except Exception as e:
@@ -428,14 +475,9 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
                     # a leader election and continue.
                     logger.warning("In MonitorMessages where the leader has died.")
 
-            # Check to ensure that this isn't creating a double connection.
-            # This could happen if the client was lost and is restarting.
-            if request.username in self.active_clients:
-                # Remove it and start again
-                self.active_clients.pop(request.username)
-            
             # Add our client to our active clients and begin listening for messages
-            # via a stream.
+            # via a stream. This replaces any earlier stream for the same user rather than
+            # creating a double connection, which could happen if the client was lost and is restarting.
             client_stream = context
             self.active_clients[request.username] = client_stream
             
@@ -443,27 +485,48 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             if request.source == "Client" and self.leader["id"] == self.server_id:
                 logger.info("Propagating MonitorMessages request from leader to replicas.")
                 new_request = service_pb2.MonitorMessagesRequest(username=request.username, source="Leader")
-                for id in self.servers:
+                for id in list(self.servers):
                     self.servers[id]["stub"].MonitorMessages(new_request)
 
-            while True:
-                # If we have a message ready to send, verify our status and yield the message to the stream.
-                if len(self.message_queue[request.username]) > 0:
-                    if context.is_active():
-                        message = self.message_queue[request.username].pop(0)
-                        logger.info(f"Sending a message to {request.username}: {message.message}")
-                        yield message
-                    else:
-                        logger.warning(f"Connection concerns with client {request.username}.")
+            # Block on the client's queue instead of polling it, so an idle stream costs no CPU.
+            # When the client disconnects, wake the waiting worker with a None so it notices straight away.
+            user_queue = self.user_queue(request.username)
+            def wake():
+                try:
+                    user_queue.put_nowait(None)
+                except queue.Full:
+                    # A full queue is not waited on, so the loop sees the closed context on its next pass.
+                    pass
+            context.add_callback(wake)
+            while context.is_active():
+                try:
+                    message = user_queue.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                # Take whatever else is already waiting, without blocking, so a burst goes out as one write.
+                batch = [] if message is None else [message]
+                while len(batch) < MONITOR_BATCH_SIZE:
+                    try:
+                        message = user_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if message is not None:
+                        batch.append(message)
+                if not batch:
+                    continue
+                logger.info("Sending %s message(s) to %s", len(batch), request.username)
+                yield service_pb2.MessageBatch(messages=batch)
             
         except Exception as e:
-            logger.error(f"Failed to send a message or lost connection to client with error {e}")
+            logger.error("Failed to send a message or lost connection to client with error %s", e)
         
         finally:
-            # When the client's stream closes, remove them from the active clients.
-            logger.info(f"Client disconnected with username: {request.username}")
-            # if request.username in self.active_clients:
-            #     self.active_clients.pop(request.username)
+            # When the client's stream closes, remove them from the active clients. The context identifies
+            # this stream, so a dying stream never evicts a newer one from a client that has reconnected.
+            logger.info("Client disconnected with username: %s", request.username)
+            with self.clients_lock:
+                if self.active_clients.get(request.username) is context:
+                    del self.active_clients[request.username]
 
 
     # MARK: Account Settings
@@ -481,7 +544,7 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             DeleteAccountResponse: Returns the status (DeleteAccountStatus) of SUCCESS or FAILURE.
         """
         try:
-            logger.info(f"Handling request to delete account with username {request.username}.")
+            logger.info("Handling request to delete account with username %s.", request.username)
 
             # If we are not the leader and the request is from a client, forward the request to the leader.
             if request.source == "Client" and self.leader["id"] != self.server_id:
@@ -489,29 +552,25 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
                 return self.leader["stub"].DeleteAccount(request)
     
             status = self.db_manager.delete_account(request.username)
+            if status:
+                self.invalidate_contacts()
 
             # If the leader is handling this request, forward it to all of the replicas.
             if request.source == "Client" and self.leader["id"] == self.server_id:
                 logger.info("Propagating delete account request from leader to replicas.")
                 new_request = service_pb2.DeleteAccountRequest(username=request.username, source="Leader")
-                for id in self.servers:
+                for id in list(self.servers):
                     self.servers[id]["stub"].DeleteAccount(new_request)
 
             if status:
-                logger.info(f"Account successfully deleted for user {request.username}.")
-                return service_pb2.DeleteAccountResponse(
-                    status=service_pb2.DeleteAccountResponse.DeleteAccountStatus.SUCCESS
-                )
+                logger.info("Account successfully deleted for user %s.", request.username)
+                return _DELETE_OK_RESPONSE
             else:
-                logger.warning(f"Could not delete account for user {request.username}")
-                return service_pb2.DeleteAccountResponse(
-                    status=service_pb2.DeleteAccountResponse.DeleteAccountStatus.FAILURE
-                )
+                logger.warning("Could not delete account for user %s", request.username)
+                return _DELETE_FAIL_RESPONSE
         except Exception as e:
-            logger.error(f"Failed to delete account for user {request.username} with error {e}")
-            return service_pb2.DeleteAccountResponse(
-                status=service_pb2.DeleteAccountResponse.DeleteAccountStatus.FAILURE
-            )
+            logger.error("Failed to delete account for user %s with error %s", request.username, e)
+            return _DELETE_FAIL_RESPONSE
     
     def SaveSettings(self, request : service_pb2.SaveSettingsRequest, context) -> service_pb2.SaveSettingsResponse:
         """
@@ -528,7 +587,7 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             SaveSettingsResponse: Returns the status (SaveSettingsStatus) of SUCCESS or FAILURE of saving the new limit.
         """
         try:
-            logger.info(f"Handling save setting request from {request.username} to update setting to {request.setting}.")
+            logger.info("Handling save setting request from %s to update setting to %s.", request.username, request.setting)
 
             # If we are not the leader and the request is from a client, forward the request to the leader.
             if request.source == "Client" and self.leader["id"] != self.server_id:
@@ -541,24 +600,18 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             if request.source == "Client" and self.leader["id"] == self.server_id:
                 logger.info("Propagating SaveSettings request from leader to replicas.")
                 new_request = service_pb2.SaveSettingsRequest(username=request.username, setting=request.setting, source="Leader")
-                for id in self.servers:
+                for id in list(self.servers):
                     self.servers[id]["stub"].SaveSettings(new_request)
 
             if status:
-                logger.info(f"Successfully updated user settings for user {request.username}.")
-                return service_pb2.SaveSettingsResponse(
-                    status=service_pb2.SaveSettingsResponse.SaveSettingsStatus.SUCCESS
-                )
+                logger.info("Successfully updated user settings for user %s.", request.username)
+                return _SAVE_OK_RESPONSE
             else:
-                logger.warning(f"Unable to save setting for user {request.username}.")
-                return service_pb2.SaveSettingsResponse(
-                    status=service_pb2.SaveSettingsResponse.SaveSettingsStatus.FAILURE
-                )
+                logger.warning("Unable to save setting for user %s.", request.username)
+                return _SAVE_FAIL_RESPONSE
         except Exception as e:
-            logger.error(f"Failed with error to save setting for user {request.username} with error: {e}")
-            return service_pb2.SaveSettingsResponse(
-                status=service_pb2.SaveSettingsResponse.SaveSettingsStatus.FAILURE
-            )
+            logger.error("Failed with error to save setting for user %s with error: %s", request.username, e)
+            return _SAVE_FAIL_RESPONSE
 
     def GetSettings(self, request : service_pb2.GetSettingsRequest, context) -> service_pb2.GetSettingsResponse:
         """
@@ -575,16 +628,16 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
                 - setting (int32): the limit of notifications to receive at one time.
         """
         try: 
-            logger.info(f"Retrieving settings for user {request.username}.")
+            logger.info("Retrieving settings for user %s.", request.username)
             settings = self.db_manager.get_settings(request.username)
             return service_pb2.GetSettingsResponse(
-                status=service_pb2.GetSettingsResponse.GetSettingsStatus.SUCCESS,
+                status=_SETTINGS_OK,
                 setting=settings
             )
         except Exception as e:
-            logger.error(f"Failed with error to retrieve settings for user {request.username} with error: {e}")
+            logger.error("Failed with error to retrieve settings for user %s with error: %s", request.username, e)
             return service_pb2.GetSettingsResponse(
-                status=service_pb2.GetSettingsResponse.GetSettingsStatus.FAILURE,
+                status=_SETTINGS_FAIL,
                 setting=0
             )
     
@@ -601,13 +654,12 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
         try:
             logger.info(f"Setting up replica by connecting it to {ip_connect}:{port_connect}")
             # Connect to the provided other server
-            initial_channel = grpc.insecure_channel(f'{ip_connect}:{port_connect}')
+            initial_channel = grpc.insecure_channel(grpc_target(ip_connect, port_connect))
             initial_stub = service_pb2_grpc.MessageServerStub(initial_channel)
             leader_info_response = initial_stub.NewReplica(service_pb2.NewReplicaRequest(new_replica_id=self.server_id, ip=self.ip, port=self.port))
 
             # Connect to the leader that was passed back by the first server.
-            leader_channel = grpc.insecure_channel(f'{leader_info_response.ip}:{leader_info_response.port}')
-            leader_stub = service_pb2_grpc.MessageServerStub(leader_channel)
+            leader_stub = PeerPool(leader_info_response.ip, leader_info_response.port)
             self.leader["stub"] = leader_stub
             self.leader["id"] = leader_info_response.id
             self.leader["ip"] = leader_info_response.ip
@@ -616,8 +668,7 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             # Retrieve information about the other active, online servers.
             servers = self.leader["stub"].GetServers(service_pb2.GetServersRequest(requestor_id=self.server_id))
             for server in servers:
-                server_channel = grpc.insecure_channel(f'{server.ip}:{server.port}')
-                server_stub = service_pb2_grpc.MessageServerStub(server_channel)
+                server_stub = PeerPool(server.ip, server.port)
                 self.servers[server.id] = {"ip": server.ip, "port": server.port, "heartbeat": datetime.now(), "stub": server_stub}
             # Add the leader to our list of servers as well for ease of use.
             self.servers[leader_info_response.id] = {"ip": leader_info_response.ip, "port": leader_info_response.port, "stub": leader_stub, "heartbeat": datetime.now()}
@@ -643,7 +694,7 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
         """
         try:
             logger.info(f"Handling request to GetServers by {request.requestor_id}")
-            for server_id, info in self.servers.items():
+            for server_id, info in list(self.servers.items()):
                 if not request.requestor_id == server_id:
                     serialized_server = service_pb2.ServerInfoResponse(id=server_id, ip=info["ip"], port=info["port"])
                     yield serialized_server
@@ -669,13 +720,17 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
         try:
             logger.info(f"Handling request to add NewReplica with id: {request.new_replica_id} at {request.ip}:{request.port}")
             # A new server will call this function first to inform the leader that they now exist.
-            channel = grpc.insecure_channel(f'{request.ip}:{request.port}')
-            stub = service_pb2_grpc.MessageServerStub(channel)
+            stub = PeerPool(request.ip, request.port)
+            previous = self.servers.get(request.new_replica_id)
             self.servers[request.new_replica_id] = {"ip": request.ip, "port": request.port, "stub": stub, "heartbeat": datetime.now()}
+            self.roster_version += 1
+            if previous is not None:
+                # A restarted replica replaces its old entry, so release the old connections.
+                self.release_stub(previous["stub"])
 
             logger.info("Forward announcement of new replica to all other servers.")
             if self.leader["id"] == self.server_id:
-                for id in self.servers:
+                for id in list(self.servers):
                     if not request.new_replica_id == id:
                         try:
                             self.servers[id]["stub"].NewReplica(request) # Send same request to all servers
@@ -693,11 +748,18 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             request (HeartbeatRequest): Contains the request details.
                 - requestor_id (str): The id of the server sending the heartbeat
                 - server_id (str): The id of the intended recipient of the heartbeat
+                - roster_version (int): The requestor's roster version
+                - added_peers (ServerInfoResponse): Servers the requestor knows of that it has not yet announced to us
+                - removed_peers (str): Ids of servers the requestor has removed since its last announcement to us
+                - liveness (map): How long ago, in milliseconds, the requestor last heard from each server
+                - acked_roster_version (int): The latest of our roster versions the requestor has applied
             context (RPCContext): The RPC call context, containing information about the client.
 
         Returns HeartbeatResponse: The response of the server to the heartbeat request.
                 - responder_id (str): The id of the server responding to the heartbeat
                 - status (str): A description of the state
+                - roster_version, added_peers, removed_peers: Our own roster changes for the requestor
+                - liveness (map): How long ago, in milliseconds, we last heard from each server
         """
         try:
             # logger.info(f"Heartbeat requested from server: {request.requestor_id} reaching out to server: {request.server_id}")
@@ -709,33 +771,186 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
             # Update the timestamp of the requestor and send a response.
             requestor_id = request.requestor_id
             server_id = request.server_id
-            self.update_heartbeat(requestor_id)
-            return service_pb2.HeartbeatResponse(responder_id=self.server_id, status="Heartbeat received")
+            peer = self.servers.get(requestor_id)
+            if peer is None:
+                # A replica that joined through another server may reach us before we have learned of it.
+                # Reply without roster or liveness data; a roster_version of -1 is never applied, so the
+                # requestor will still take our real roster once it has been announced to us.
+                return service_pb2.HeartbeatResponse(responder_id=self.server_id, status="Heartbeat received", roster_version=-1)
+            peer["heartbeat"] = datetime.now()
+            self.merge_liveness(request.liveness)
+
+            # Apply the roster changes the requestor piggybacked, and reply with our own.
+            self.apply_roster(requestor_id, request.roster_version, request.added_peers, request.removed_peers)
+
+            # Our last reply may never have arrived, so only count its changes as announced
+            # once the requestor tells us it applied that roster version.
+            offered = peer.pop("offered", None)
+            if offered is not None and request.acked_roster_version >= offered[0]:
+                peer["announced"] = offered[1]
+            announced, added_peers, removed_peers = self.roster_delta(requestor_id)
+            peer["offered"] = (self.roster_version, announced)
+            return service_pb2.HeartbeatResponse(
+                responder_id=self.server_id,
+                status="Heartbeat received",
+                roster_version=self.roster_version,
+                added_peers=added_peers,
+                removed_peers=removed_peers,
+                liveness=self.liveness())
         except Exception as e:
             logger.error(f"Error occurred in Heartbeat request: {e}")
 
+    def contacts(self):
+        """Return every registered username, reading the database only when the cached list has expired."""
+        with self.contacts_lock:
+            if time.monotonic() >= self.contacts_expiry:
+                users = self.db_manager.get_contacts()
+                if users is None:
+                    raise RuntimeError("Could not fetch the list of users.")
+                self.contacts_cache = tuple(users)
+                self.contacts_expiry = time.monotonic() + CONTACTS_TTL
+            return self.contacts_cache
+
+    def invalidate_contacts(self):
+        """Make the next GetUsers call read the list of usernames from the database again."""
+        # Take the lock so a refresh that read the table before this change cannot overwrite the invalidation.
+        with self.contacts_lock:
+            self.contacts_expiry = 0.0
+
+    def user_queue(self, username):
+        """Return the queue of messages waiting to be streamed to a user, creating it on first use."""
+        user_queue = self.message_queue.get(username)
+        if user_queue is None:
+            # Create under the lock, so two threads cannot each install their own queue and lose messages.
+            with self.clients_lock:
+                user_queue = self.message_queue.setdefault(username, queue.Queue(maxsize=MAX_QUEUED_MESSAGES))
+        return user_queue
+
     def update_heartbeat(self, id):
         """Update heartbeat timestamp for the server"""
         # logger.info(f"Heartbeat from {id} updated at {self.servers[id]}")
         self.servers[id]["heartbeat"] = datetime.now()
 
+    def roster_delta(self, peer_id):
+        """
+        Compute the changes to our list of servers that have not yet been announced to a peer.
+
+        Returns:
+            A tuple of the server ids the peer will know of once the delta is delivered, the added
+            servers (as ServerInfoResponse), and the ids of the removed servers.
+        """
+        current = {id for id in list(self.servers) if id != peer_id}
+        announced = self.servers[peer_id].get("announced", set())
+        added_peers = [
+            service_pb2.ServerInfoResponse(id=id, ip=self.servers[id]["ip"], port=self.servers[id]["port"])
+            for id in current - announced
+        ]
+        return current, added_peers, list(announced - current)
+
+    def apply_roster(self, peer_id, roster_version, added_peers, removed_peers):
+        """
+        Apply the roster changes a peer piggybacked on a heartbeat, unless we have already
+        applied this version (or a newer one) from that peer.
+        """
+        peer = self.servers.get(peer_id)
+        if peer is None or roster_version <= peer.get("roster_version", -1):
+            return
+        peer["roster_version"] = roster_version
+
+        for server in added_peers:
+            if server.id != self.server_id and server.id not in self.servers:
+                logger.info(f"Learned of server {server.id} at {server.ip}:{server.port} from {peer_id}.")
+                self.servers[server.id] = {"ip": server.ip, "port": server.port, "stub": PeerPool(server.ip, server.port), "heartbeat": datetime.now()}
+                self.roster_version += 1
+
+        for id in removed_peers:
+            # Leader failures are always detected locally so that each server runs its own election.
+            # Also ignore removals of servers we have heard from within the last heartbeat interval.
+            if id not in self.servers or id == self.leader["id"]:
+                continue
+            if datetime.now() - self.servers[id]["heartbeat"] > timedelta(seconds=1):
+                logger.info(f"Removing server {id} as reported by {peer_id}.")
+                self.release_stub(self.servers.pop(id)["stub"])
+                self.roster_version += 1
+
+    def release_stub(self, stub):
+        """Close a peer's connection pool, unless the leader or another server still shares it."""
+        if stub is None or stub is self.leader.get("stub"):
+            return
+        if any(info["stub"] is stub for info in list(self.servers.values())):
+            return
+        stub.close()
+
+    def ring_successor(self):
+        """Return the id of the server after us in the heartbeat ring, which is ordered by UUID."""
+        ring = sorted(list(self.servers) + [self.server_id])
+        return ring[(ring.index(self.server_id) + 1) % len(ring)]
+
+    def liveness(self):
+        """Return how long ago, in milliseconds, we last heard from each server (including ourselves)."""
+        current_time = datetime.now()
+        ages = {self.server_id: 0}
+        for server_id, info in list(self.servers.items()):
+            ages[server_id] = int((current_time - info["heartbeat"]).total_seconds() * 1000)
+        return ages
+
+    def merge_liveness(self, liveness):
+        """Adopt any heartbeat in a gossiped liveness map that is more recent than our own."""
+        current_time = datetime.now()
+        for server_id, age in liveness.items():
+            # Look the server up once, since another thread may remove it at any moment.
+            info = self.servers.get(server_id)
+            if info is not None:
+                heard = current_time - timedelta(milliseconds=age)
+                if heard > info["heartbeat"]:
+                    info["heartbeat"] = heard
+
+    def send_heartbeat(self, id):
+        """Send a heartbeat to the given server. Returns whether the server responded."""
+        try:
+            announced, added_peers, removed_peers = self.roster_delta(id)
+            heartbeat_request = service_pb2.HeartbeatRequest(
+                requestor_id=self.server_id,
+                server_id=id,
+                roster_version=self.roster_version,
+                added_peers=added_peers,
+                removed_peers=removed_peers,
+                liveness=self.liveness(),
+                acked_roster_version=self.servers[id].get("roster_version", -1))
+            response = self.servers[id]["stub"].Heartbeat(heartbeat_request, timeout=1)
+            self.update_heartbeat(id)
+            self.merge_liveness(response.liveness)
+            self.servers[id]["announced"] = announced
+            self.apply_roster(id, response.roster_version, response.added_peers, response.removed_peers)
+            return True
+        except Exception as e:
+            # We handle the exceptions from failed servers in the check_and_remove_failed_replicas()
+            return False
+
     def _heartbeat(self):
-        """Handle the background daemon of sending heartbeats and removing failed servers."""
-        if self.leader["id"] == self.server_id:
-            # If I am the leader, I don't need to send heartbeats, but if I stop receiving
-            # them from the replicas, then I know something has gone wrong with the replica.
-            self.check_and_remove_failed_replicas()
-            threading.Timer(1, self._heartbeat).start()  # Schedule the next heartbeat in 2 seconds
-        else:
-            for id in self.servers:
-                try:
-                    heartbeat_request = self.servers[id]["stub"].Heartbeat(service_pb2.HeartbeatRequest(requestor_id=self.server_id, server_id=id))
-                    self.update_heartbeat(id)
-                except Exception as e:
-                    # We handle the exceptions from failed servers in the check_and_remove_failed_replicas()
-                    pass
+        """
+        Handle the background daemon of sending heartbeats and removing failed servers.
+
+        Servers form a ring ordered by UUID, and each server only sends heartbeats to its successor.
+        Every heartbeat (and its response) carries the sender's view of when it last heard from each
+        server, so liveness spreads around the ring with one heartbeat per server per interval rather
+        than one per pair of servers. If our successor misses two heartbeats in a row, we fall back to
+        sending heartbeats to every server until it responds again.
+        """
+        try:
+            if self.servers:
+                successor = self.ring_successor()
+                targets = [successor] if self.ring_failures < 2 else list(self.servers)
+                for id in targets:
+                    delivered = self.send_heartbeat(id)
+                    if id == successor:
+                        self.ring_failures = 0 if delivered else self.ring_failures + 1
             self.check_and_remove_failed_replicas()
-            threading.Timer(1, self._heartbeat).start() # Schedule the next heartbeat in 2 seconds
+        except Exception as e:
+            logger.error(f"Heartbeat round failed with error: {e}")
+        finally:
+            # Always schedule the next heartbeat in 1 second, so one bad round does not stop them for good.
+            threading.Timer(1, self._heartbeat).start()
 
     def check_and_remove_failed_replicas(self):
         """Handle failed servers."""
@@ -743,51 +958,56 @@ class MessageServer(service_pb2_grpc.MessageServerServicer):
 
         current_time = datetime.now()
         failed_replicas = []
-        for server_id, info in self.servers.items():
+        for server_id, info in list(self.servers.items()):
             last_heartbeat = info["heartbeat"]
             
             # Ensure last_heartbeat is a datetime object, if not convert it.
             if isinstance(last_heartbeat, str):  # If it's a string
                 last_heartbeat = datetime.fromisoformat(last_heartbeat)  # Convert string to datetime
             
-            # Check the difference between current time and last heartbeat
-            if current_time - last_heartbeat > timedelta(seconds=3):
+            # Check the difference between current time and last heartbeat. Heartbeats from servers
+            # further around the ring reach us by gossip, so allow a second per extra hop.
+            if current_time - last_heartbeat > timedelta(seconds=3 + len(self.servers) // 2):
                 logger.warning(f"Server {server_id} has failed due to lack of heartbeat response! Removing now.")
                 failed_replicas.append(server_id)
         
         for id in failed_replicas:
-            del self.servers[id]
+            removed = self.servers.pop(id, None)
+            if removed is None:
+                # Another thread already removed it.
+                continue
+            stub = removed["stub"]
+            self.roster_version += 1
             if id == self.leader["id"]:
                 # If we have lost the leader, then we must facilitate a new leader election!
                 self.run_election()
+            self.release_stub(stub)
 
     def run_election(self):
         """Handle electing a new leader. Utilises the lowest UUID of the existing servers."""
+        previous = self.leader.get("stub")
         # If we are the only server remaining, we become the leader.
         if len(self.servers) == 0:
             self.leader["id"] = self.server_id
             self.leader["ip"] = self.ip
             self.leader["port"] = self.port
-            channel = grpc.insecure_channel(f'{self.ip}:{self.port}')
-            stub = service_pb2_grpc.MessageServerStub(channel)
-            self.leader["stub"] = stub
+            self.leader["stub"] = PeerPool(self.ip, self.port)
+            self.release_stub(previous)
             return
 
         # Otherwise, elect a new leader by finding the lowest UUID between this server's uuid and the
         # other servers.
-        all_servers = list(self.servers.keys()) + [self.server_id]
-        next_leader_id = min(all_servers)
+        next_leader_id = min(self.server_id, *self.servers)
         self.leader["id"] = next_leader_id
 
         if next_leader_id == self.server_id:
             logger.info("Server has become the new leader.")
             self.leader["ip"] = self.ip
             self.leader["port"] = self.port
-            channel = grpc.insecure_channel(f'{self.ip}:{self.port}')
-            stub = service_pb2_grpc.MessageServerStub(channel)
-            self.leader["stub"] = stub
+            self.leader["stub"] = PeerPool(self.ip, self.port)
         else:
             logger.info("This process is still a replica. A new leader has been selected.")
             self.leader["ip"] = self.servers[next_leader_id]["ip"]
             self.leader["port"] = self.servers[next_leader_id]["port"]
             self.leader["stub"] = self.servers[next_leader_id]["stub"]
+        self.release_stub(previous)
@@ -0,0 +1,68 @@
+import sys
+import os
+import grpc
+import itertools
+import ipaddress
+# Handle our file paths properly.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from proto import service_pb2_grpc
+
+def grpc_target(host, port):
+    """
+    Build the host:port target gRPC expects for a server. IPv6 addresses must be bracketed
+    (e.g. [::1]:5001), otherwise the last colon-separated group is mistaken for the port.
+    Hostnames and IPv4 addresses are used as they are.
+    """
+    try:
+        if ipaddress.ip_address(host).version == 6:
+            return f'[{host}]:{port}'
+    except ValueError:
+        pass
+    return f'{host}:{port}'
+
+# Ping the peer every 10s, even with no call in flight, and drop the connection if a ping goes unanswered
+# for 5s. A dead peer's connection is then noticed by gRPC itself, and calls fail fast instead of
+# waiting on a half-open socket. This matches the keepalive the servers accept (SERVER_OPTIONS in main.py).
+KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 10000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+class PeerPool:
+    """
+    The PeerPool class holds a small round-robin pool of channels to another server.
+    A single HTTP/2 connection caps the number of concurrent streams, so long-lived
+    streams (such as a mirrored MonitorMessages) can hold up the rest of the replication
+    traffic. Spreading calls across several connections avoids that ceiling.
+
+    The pool can be used in place of a stub: calling pool.Heartbeat(...) dispatches the
+    RPC on the next channel in the pool.
+    """
+    def __init__(self, ip, port, size=4):
+        self.address = grpc_target(ip, port)
+        # Give every channel a distinct argument and its own subchannel pool, otherwise
+        # gRPC may collapse them onto the same underlying connection.
+        self.channels = [
+            grpc.insecure_channel(self.address, options=[("grpc.channel_index", i), ("grpc.use_local_subchannel_pool", 1), *KEEPALIVE_OPTIONS])
+            for i in range(size)
+        ]
+        self.stubs = [service_pb2_grpc.MessageServerStub(channel) for channel in self.channels]
+        self.counter = itertools.count()
+
+    def stub(self):
+        """Return the next stub in the pool."""
+        return self.stubs[next(self.counter) % len(self.stubs)]
+
+    def __getattr__(self, name):
+        """Forward RPC method lookups (e.g. Register, Heartbeat) to the next stub in the pool."""
+        # RPC methods are CamelCase; anything else is a genuinely missing attribute.
+        if not name[:1].isupper():
+            raise AttributeError(name)
+        return getattr(self.stub(), name)
+
+    def close(self):
+        """Close every channel in the pool."""
+        for channel in self.channels:
+            channel.close()
@@ -1,34 +1,87 @@
 import sys
 import os
-import grpc
 import argparse
 import logging
-import socket # For retrieving local IP address only
+import threading
+import ipaddress
 from concurrent import futures
 # Handle our file paths properly.
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from proto import service_pb2
-from proto import service_pb2_grpc
-from MessageServer import MessageServer
-
 
 # MARK: Initialize Logger
-# Configure logging set-up. We want to log times & types of logs, as well as
-# function names & the subsequent message.
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s'
-)
-
-# Create a logger
 logger = logging.getLogger(__name__)
 
+# Logging is configured here, in the entry point, rather than by the modules it imports.
+def configure_logging():
+    """
+    Log times & types of logs, as well as function names & the subsequent message. Only warnings
+    and errors are logged unless LOGLEVEL (e.g. LOGLEVEL=info) asks for more.
+    """
+    level = os.environ.get('LOGLEVEL', 'WARNING').upper()
+    known = isinstance(logging.getLevelName(level), int)
+    logging.basicConfig(
+        level=level if known else 'WARNING',
+        format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s'
+    )
+    if not known:
+        logger.warning("Unknown LOGLEVEL %r; logging warnings and errors only.", os.environ['LOGLEVEL'])
+
 # MARK: Server Initialization
+# Each MonitorMessages stream occupies a worker thread for as long as its client is connected,
+# so give worker threads a small stack instead of the platform default (typically 8 MB).
+WORKER_STACK_SIZE = 1024 * 1024
+
+# Every signed-in client's MonitorMessages stream pins a worker for the whole session, so the pool
+# must cover the expected number of connected clients plus headroom for unary RPCs. Blocked streams
+# are cheap (small stack, no CPU), so default to a large pool; GRPC_WORKERS overrides it.
+WORKERS = int(os.environ.get('GRPC_WORKERS', min(1000, 32 * (os.cpu_count() or 4))))
+
+# Streams hold no database connection while they wait, so the SQLite read pools only need to cover
+# the unary RPCs running at once. DB_CONNECTIONS overrides the default.
+DB_CONNECTIONS = int(os.environ.get('DB_CONNECTIONS', (os.cpu_count() or 4) * 4))
+
+# gRPC channel arguments for the server:
+#  - so_reuseport: 0 turns off gRPC's default of letting several processes bind the same port, so a second
+#    server started on a port already in use fails with a RuntimeError instead of silently sharing it. Each
+#    server process needs its own port, since its streams, queues and database are not shared.
+#  - max_concurrent_streams: each client holds a MonitorMessages stream open, so allow plenty per connection.
+#  - keepalive_time_ms / keepalive_timeout_ms: ping idle connections every 10s and drop them if no reply
+#    arrives within 5s, so a vanished client's stream is noticed instead of lingering.
+#  - http2.max_pings_without_data: 0 lets those pings continue on streams that are idle between messages.
+#  - keepalive_permit_without_calls: keep pinging connections with no RPC in flight, so NAT and load
+#    balancer idle timeouts do not silently drop them and cause a burst of reconnects.
+#  - http2.min_time_between_pings_ms / http2.min_ping_interval_without_data_ms: how often clients may ping
+#    us, so clients that enable their own keepalive are not disconnected for pinging too often.
+#  - http2.lookahead_bytes: start each stream with a 1 MB flow-control window instead of 64 KB, so a
+#    burst of messages is not held up waiting for window updates.
+#  - max_receive_message_length: raise the 4 MB default so large requests are not rejected.
+SERVER_OPTIONS = [
+    ('grpc.so_reuseport', 0),
+    ('grpc.max_concurrent_streams', 1024),
+    ('grpc.keepalive_time_ms', 10000),
+    ('grpc.keepalive_timeout_ms', 5000),
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.min_time_between_pings_ms', 10000),
+    ('grpc.http2.min_ping_interval_without_data_ms', 5000),
+    ('grpc.http2.lookahead_bytes', 1024 * 1024),
+    ('grpc.max_receive_message_length', 16 * 1024 * 1024),
+]
+
 def serve(ip, port, ip_connect=None, port_connect=None):
+    # gRPC and the generated protobuf modules are slow to import, so load them only once the
+    # arguments are valid. A bad command line or --help then returns straight away.
+    import grpc
+    from proto import service_pb2_grpc
+    from MessageServer import MessageServer
+    from PeerPool import grpc_target
+
+    # Threads created from here on (gRPC workers and heartbeat timers) use the smaller stack.
+    threading.stack_size(WORKER_STACK_SIZE)
     # Create our connection and launch the MessageServer.
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    service_pb2_grpc.add_MessageServerServicer_to_server(MessageServer(ip, port, ip_connect, port_connect), server)
-    server.add_insecure_port(f'{ip}:{port}')
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='grpc-rpc'), options=SERVER_OPTIONS)
+    service_pb2_grpc.add_MessageServerServicer_to_server(MessageServer(ip, port, ip_connect, port_connect, pool_size=DB_CONNECTIONS), server)
+    server.add_insecure_port(grpc_target(ip, port))
     server.start()
     logger.info(f"Server started on port {port} for ip {ip}")
     server.wait_for_termination()
@@ -36,12 +89,10 @@ def serve(ip, port, ip_connect=None, port_connect=None):
 
 # MARK: Command-line arguments.
 def validate_ip(value):
-    """Validate an IP address"""
+    """Validate an IPv4 or IPv6 address, returning it in its normalized form."""
     try:
-        # Try to convert the value to a valid IP address using socket library
-        socket.inet_aton(value)  # This will raise an error if not a valid IPv4 address
-        return value
-    except socket.error:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
         raise argparse.ArgumentTypeError(f"Invalid IP address: {value}")
 
 def parse_arguments():
@@ -81,6 +132,7 @@ def parse_arguments():
 
 # MARK: MAIN
 if __name__ == "__main__":
+    configure_logging()
     # Set up arguments.
     args = parse_arguments()
     ip = args.ip
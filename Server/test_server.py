@@ -2,23 +2,44 @@ import sys, os
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 import os
+import queue
 import sqlite3
+import hashlib
+import tempfile
+import time
 import unittest
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from types import SimpleNamespace
+from unittest.mock import patch
 
 # Import the server and its dependencies.
 from MessageServer import MessageServer
 from DatabaseManager import DatabaseManager
+from AuthHandler import AuthHandler
+from PeerPool import PeerPool, grpc_target
 from proto import service_pb2
 
+# Status values the tests compare responses against.
+REG_OK = service_pb2.RegisterResponse.RegisterStatus.SUCCESS
+REG_FAIL = service_pb2.RegisterResponse.RegisterStatus.FAILURE
+LOGIN_OK = service_pb2.LoginResponse.LoginStatus.SUCCESS
+PEND_OK = service_pb2.PendingMessageResponse.PendingMessageStatus.SUCCESS
+MSG_OK = service_pb2.MessageResponse.MessageStatus.SUCCESS
+DEL_OK = service_pb2.DeleteAccountResponse.DeleteAccountStatus.SUCCESS
+SAVE_OK = service_pb2.SaveSettingsResponse.SaveSettingsStatus.SUCCESS
+_Message = service_pb2.Message
+
 
 # --- Dummy Classes for Testing --- #
 
 class DummyContext:
-    """A dummy gRPC context with an is_active() method."""
+    """A dummy gRPC context with an is_active() method. Also stands in for a client's stream in active_clients."""
+    __slots__ = ('active',)
+    def __init__(self, active=True):
+        self.active = active
     def is_active(self):
-        return True
+        return self.active
 
 class OneTimeActiveContext:
     """A dummy context that is active only once (for MonitorMessages test)."""
@@ -29,6 +50,8 @@ class OneTimeActiveContext:
             self.calls += 1
             return True
         return False
+    def add_callback(self, callback):
+        return True
 
 class DummyAuthHandler:
     """A dummy authentication handler that always returns success."""
@@ -48,21 +71,55 @@ class DummyFailAuthHandler:
 # --- Test Suite --- #
 
 class TestMessageServer(unittest.TestCase):
+    # Use a test-specific IP and port. Under pytest-xdist each worker (gw0, gw1, ...) takes its own
+    # port, and so its own database file.
+    ip = "127.0.0.1"
+    port = str(5001 + int(os.environ.get("PYTEST_XDIST_WORKER", "gw0")[2:]))
+    db_file = f"{ip}_{port}.db"
+    # A fixed client timestamp for the messages tests send, so runs are reproducible. Server
+    # heartbeats keep using datetime.now(), since liveness checks compare them with the clock.
+    TIMESTAMP = str(datetime(2025, 3, 1, 12, 0, 0))
+
+    @classmethod
+    def setUpClass(cls):
+        # Opening the database and its connection pools is the slow part of building a server,
+        # so do it once and share the manager between tests.
+        cls.db_manager = DatabaseManager(cls.ip, cls.port)
+        # Tests seed and inspect the tables through one autocommit connection of their own, so
+        # every statement is visible to the server's pools as soon as it returns.
+        cls.conn = sqlite3.connect(cls.db_file, isolation_level=None)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Release the pooled connections, then remove the database (and its WAL files).
+        cls.conn.close()
+        cls.db_manager.close()
+        for path in (cls.db_file, f"{cls.db_file}-wal", f"{cls.db_file}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
     def setUp(self):
-        # Use a test-specific IP and port.
-        self.ip = "127.0.0.1"
-        self.port = "5001"
-        # Instantiate the server as leader (no ip_connect/port_connect)
-        self.server = MessageServer(self.ip, self.port)
-        # Override the auth_manager with our dummy version.
-        self.server.auth_manager = DummyAuthHandler()
-        # Make sure the database is set up cleanly.
-        self.db_file = f"{self.ip}_{self.port}.db"
+        # Instantiate the server as leader (no ip_connect/port_connect), with our dummy auth_manager.
+        # Each test gets a fresh server, so only the shared database needs clearing.
+        # The leader would start its heartbeat loop, which could evict the peers a test seeds while it
+        # asserts on them, so start it with a no-op loop; tests call Heartbeat and friends directly.
+        with patch.object(MessageServer, "_heartbeat"):
+            self.server = MessageServer(self.ip, self.port, db_manager=self.db_manager, auth_manager=DummyAuthHandler())
+        self.conn.execute("DELETE FROM users")
+        self.conn.execute("DELETE FROM messages")
+        self.db_manager.settings_cache.clear()
+
+    def _seed_users(self, rows):
+        """Insert (username, password_hash, email) rows in one transaction. Users start with the default settings of 50."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany("INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)", rows)
+        self.conn.execute("COMMIT")
 
-    def tearDown(self):
-        # Remove the database file after each test.
-        if os.path.exists(self.db_file):
-            os.remove(self.db_file)
+    def _seed_messages(self, rows):
+        """Insert (sender, recipient, message, timestamp, isPending) rows in one transaction."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany("INSERT INTO messages (sender, recipient, message, timestamp, isPending) VALUES (?, ?, ?, ?, ?)", rows)
+        self.conn.execute("COMMIT")
 
     def test_register(self):
         request = SimpleNamespace(
@@ -74,9 +131,21 @@ class TestMessageServer(unittest.TestCase):
         context = DummyContext()
         response = self.server.Register(request, context)
         # Check that the response indicates success.
-        self.assertEqual(response.status, service_pb2.RegisterResponse.RegisterStatus.SUCCESS)
+        self.assertEqual(response.status, REG_OK)
         self.assertEqual(response.message, "Registration successful")
 
+    def test_register_failure(self):
+        self.server.auth_manager = DummyFailAuthHandler()
+        request = SimpleNamespace(
+            username="user_fail",
+            password="pass_fail",
+            email="user_fail@example.com",
+            source="Client"
+        )
+        response = self.server.Register(request, DummyContext())
+        self.assertEqual(response.status, REG_FAIL)
+        self.assertEqual(response.message, "Registration failed")
+
     def test_login(self):
         request = SimpleNamespace(
             username="user1",
@@ -85,7 +154,7 @@ class TestMessageServer(unittest.TestCase):
         )
         context = DummyContext()
         response = self.server.Login(request, context)
-        self.assertEqual(response.status, service_pb2.LoginResponse.LoginStatus.SUCCESS)
+        self.assertEqual(response.status, LOGIN_OK)
         self.assertEqual(response.message, "Login successful")
 
     def test_login_failure(self):
@@ -98,40 +167,40 @@ class TestMessageServer(unittest.TestCase):
         )
         context = DummyContext()
         response = self.server.Login(request, context)
-        self.assertNotEqual(response.status, service_pb2.LoginResponse.LoginStatus.SUCCESS)
+        self.assertNotEqual(response.status, LOGIN_OK)
         self.assertEqual(response.message, "Login failed")
 
     def test_get_users(self):
         # Insert a dummy user into the users table.
-        with sqlite3.connect(self.server.db_manager.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)",
-                ("user1", "hash", "user1@example.com")
-            )
-            conn.commit()
+        self._seed_users([("user1", "hash", "user1@example.com")])
         request = SimpleNamespace(username="user1")
         context = DummyContext()
-        responses = list(self.server.GetUsers(request, context))
-        usernames = [resp.username for resp in responses if resp.username]
-        self.assertIn("user1", usernames)
+        # Stop reading the stream as soon as the user turns up.
+        self.assertTrue(any(resp.username == "user1" for resp in self.server.GetUsers(request, context)))
+
+    def test_get_users_cached(self):
+        def add_user(username):
+            self._seed_users([(username, "hash", None)])
+        def get_users():
+            return [resp.username for resp in self.server.GetUsers(SimpleNamespace(username="user1"), DummyContext())]
+        add_user("cached1")
+        self.assertEqual(get_users(), ["cached1"])
+        # Users added behind the server's back are not seen until the cache is invalidated...
+        add_user("cached2")
+        self.assertEqual(get_users(), ["cached1"])
+        # ...which a successful registration does.
+        self.server.Register(SimpleNamespace(username="cached3", password="pass", email="", source="Leader"), DummyContext())
+        self.assertEqual(sorted(get_users()), ["cached1", "cached2"])
 
    
     def test_get_message_history(self):
         # Insert delivered (non-pending) messages for user2.
-        timestamp = int(datetime.now().timestamp())
-        with sqlite3.connect(self.server.db_manager.db_name) as conn:
-            cursor = conn.cursor()
-            messages = [
-                ("user1", "user2", "Delivered 1", timestamp, False),
-                ("user2", "user1", "Delivered 2", timestamp + 1, False)
-            ]
-            cursor.executemany(
-                "INSERT INTO messages (sender, recipient, message, timestamp, isPending) VALUES (?, ?, ?, ?, ?)",
-                messages
-            )
-            conn.commit()
-        request = SimpleNamespace(username="user2")
+        timestamp = int(datetime.fromisoformat(self.TIMESTAMP).timestamp() * 1000)
+        self._seed_messages([
+            ("user1", "user2", "Delivered 1", timestamp, False),
+            ("user2", "user1", "Delivered 2", timestamp + 1, False)
+        ])
+        request = SimpleNamespace(username="user2", limit=0)
         context = DummyContext()
         history = list(self.server.GetMessageHistory(request, context))
         # Verify that at least one delivered message is returned.
@@ -142,43 +211,120 @@ class TestMessageServer(unittest.TestCase):
             self.assertNotEqual(msg.message, "")  # simple check that message is non-empty
 
 
+    def test_message_timestamps_epoch_ms(self):
+        timestamp = "2025-03-01 12:30:45.123456"
+        self.server.db_manager.save_message("user1", "user2", "Timed message", timestamp, False)
+        # Stored as integer epoch milliseconds...
+        with self.conn as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT timestamp FROM messages WHERE message=?", ("Timed message",))
+            stored = cursor.fetchone()[0]
+        self.assertIsInstance(stored, int)
+        self.assertEqual(stored, int(datetime.fromisoformat(timestamp).timestamp() * 1000))
+        # ...and returned to clients as a datetime string (to millisecond precision).
+        history = list(self.server.GetMessageHistory(SimpleNamespace(username="user2", limit=0), DummyContext()))
+        self.assertEqual(history[0].timestamp, "2025-03-01 12:30:45.123000")
+
+
+    def test_get_message_history_limit(self):
+        rows = [("user1", "user2", f"Message {i}", i, False) for i in range(5)]
+        self.server.db_manager.save_messages(rows)
+        request = SimpleNamespace(username="user2", limit=2)
+        history = list(self.server.GetMessageHistory(request, DummyContext()))
+        # Only the most recent messages come back, still oldest first.
+        self.assertEqual([msg.message for msg in history], ["Message 3", "Message 4"])
+
+    def test_get_pending_messages(self):
+        self.server.db_manager.save_message("user1", "user4", "Pending 1", "2025-03-01 12:00:00", True)
+        request = SimpleNamespace(username="user4", inbox_limit=5, source="Leader")
+        responses = list(self.server.GetPendingMessage(request, DummyContext()))
+        self.assertEqual([msg.message for resp in responses for msg in resp.messages], ["Pending 1"])
+        self.assertEqual(responses[0].messages[0].timestamp, "2025-03-01 12:00:00")
+        # Delivered messages are no longer pending.
+        self.assertEqual(self.server.db_manager.get_pending_messages("user4"), [])
+
+    def test_get_pending_messages_inbox_limit(self):
+        rows = [("user1", "user5", f"Pending {i}", i, True) for i in range(3)]
+        self.server.db_manager.save_messages(rows)
+        request = SimpleNamespace(username="user5", inbox_limit=2, source="Leader")
+        responses = list(self.server.GetPendingMessage(request, DummyContext()))
+        self.assertEqual([msg.message for resp in responses for msg in resp.messages], ["Pending 0", "Pending 1"])
+        # Messages beyond the inbox limit stay pending for the next request.
+        remaining = self.server.db_manager.get_pending_messages("user5")
+        self.assertEqual([row[3] for row in remaining], ["Pending 2"])
+
+    def test_get_pending_messages_propagates(self):
+        # A client's request to the leader is passed on to each replica as a PendingMessageRequest.
+        forwarded = []
+        replica_stub = SimpleNamespace(GetPendingMessage=forwarded.append)
+        self.server.servers = {"replica": {"ip": "127.0.0.2", "port": "5002", "stub": replica_stub, "heartbeat": datetime.now()}}
+        self.server.db_manager.save_message("user1", "user9", "Pending", self.TIMESTAMP, True)
+        request = SimpleNamespace(username="user9", inbox_limit=5, source="Client")
+        responses = list(self.server.GetPendingMessage(request, DummyContext()))
+        self.assertEqual([resp.status for resp in responses], [PEND_OK])
+        self.assertEqual(len(forwarded), 1)
+        self.assertEqual((forwarded[0].username, forwarded[0].inbox_limit, forwarded[0].source), ("user9", 5, "Leader"))
+
+    @patch.object(DatabaseManager, "pending_messages_sent")
+    def test_get_pending_messages_none_waiting(self, pending_messages_sent):
+        # With nothing pending, the stream ends straight away without marking anything delivered.
+        request = SimpleNamespace(username="user8", inbox_limit=5, source="Leader")
+        self.assertEqual(list(self.server.GetPendingMessage(request, DummyContext())), [])
+        pending_messages_sent.assert_not_called()
+
+    def test_get_pending_messages_batched(self):
+        rows = [("user1", "user7", f"Pending {i}", i, True) for i in range(40)]
+        self.server.db_manager.save_messages(rows)
+        request = SimpleNamespace(username="user7", inbox_limit=50, source="Leader")
+        responses = list(self.server.GetPendingMessage(request, DummyContext()))
+        # 40 messages fit in one full batch and one partial batch, in order.
+        self.assertEqual([len(resp.messages) for resp in responses], [32, 8])
+        self.assertEqual([msg.message for resp in responses for msg in resp.messages], [f"Pending {i}" for i in range(40)])
+
+    def test_get_pending_messages_disconnect(self):
+        rows = [("user1", "user8", f"Pending {i}", i, True) for i in range(40)]
+        self.server.db_manager.save_messages(rows)
+        request = SimpleNamespace(username="user8", inbox_limit=50, source="Leader")
+        # The client reads the first batch and then goes away.
+        stream = self.server.GetPendingMessage(request, DummyContext())
+        self.assertEqual(len(next(stream).messages), 32)
+        stream.close()
+        # Only the batch that was sent is marked as delivered.
+        pending = self.conn.execute("SELECT COUNT(*) FROM messages WHERE recipient = 'user8' AND isPending = 1").fetchone()[0]
+        self.assertEqual(pending, 8)
+
     def test_send_message_active(self):
         # Simulate an active client for recipient "user2".
-        class ActiveClientStream:
-            def is_active(self):
-                return True
-        self.server.active_clients["user2"] = ActiveClientStream()
-        timestamp = str(datetime.now())
+        self.server.active_clients["user2"] = DummyContext()
         request = SimpleNamespace(
             sender="user1",
             recipient="user2",
             message="Test message",
-            timestamp=timestamp,
+            timestamp=self.TIMESTAMP,
             source="Client"
         )
         context = DummyContext()
         response = self.server.SendMessage(request, context)
-        self.assertEqual(response.status, service_pb2.MessageResponse.MessageStatus.SUCCESS)
+        self.assertEqual(response.status, MSG_OK)
         # Verify that the message was queued for streaming.
-        self.assertGreater(len(self.server.message_queue["user2"]), 0)
+        self.assertGreater(self.server.message_queue["user2"].qsize(), 0)
 
     def test_send_message_inactive(self):
         # Ensure that "user3" is not active.
         if "user3" in self.server.active_clients:
             del self.server.active_clients["user3"]
-        timestamp = str(datetime.now())
         request = SimpleNamespace(
             sender="user1",
             recipient="user3",
             message="Test message inactive",
-            timestamp=timestamp,
+            timestamp=self.TIMESTAMP,
             source="Client"
         )
         context = DummyContext()
         response = self.server.SendMessage(request, context)
-        self.assertEqual(response.status, service_pb2.MessageResponse.MessageStatus.SUCCESS)
+        self.assertEqual(response.status, MSG_OK)
         # Check that the message was saved as pending (isPending == True).
-        with sqlite3.connect(self.server.db_manager.db_name) as conn:
+        with self.conn as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT isPending FROM messages WHERE sender=? AND recipient=? AND message=?",
@@ -188,22 +334,53 @@ class TestMessageServer(unittest.TestCase):
             self.assertIsNotNone(result)
             # SQLite stores Boolean True as 1.
             self.assertEqual(result[0], 1)
+        # Messages for offline users go to the database without creating an in-memory queue.
+        self.assertNotIn("user3", self.server.message_queue)
+
+    def test_save_messages_batch(self):
+        rows = [("user1", f"user{i}", f"Batch message {i}", self.TIMESTAMP, i % 2 == 0) for i in range(5)]
+        self.assertTrue(self.server.db_manager.save_messages(rows))
+        with self.conn as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT recipient, isPending FROM messages WHERE sender=? ORDER BY id", ("user1",))
+            self.assertEqual(cursor.fetchall(), [(f"user{i}", int(i % 2 == 0)) for i in range(5)])
+
+    def test_send_message_stale_stream(self):
+        # A recipient whose stream has dropped is removed and the message is kept as pending.
+        self.server.active_clients["user6"] = DummyContext(active=False)
+        request = SimpleNamespace(sender="user1", recipient="user6", message="Stale", timestamp=self.TIMESTAMP, source="Client")
+        response = self.server.SendMessage(request, DummyContext())
+        self.assertEqual(response.status, MSG_OK)
+        self.assertNotIn("user6", self.server.active_clients)
+        self.assertEqual(len(self.server.db_manager.get_pending_messages("user6")), 1)
+
+    def test_send_message_full_queue(self):
+        # Once a recipient's queue is full, further messages are kept as pending rather than queued.
+        self.server.active_clients["user7"] = DummyContext()
+        self.server.message_queue["user7"] = queue.Queue(maxsize=1)
+        for text in ("First", "Second"):
+            request = SimpleNamespace(sender="user1", recipient="user7", message=text, timestamp=self.TIMESTAMP, source="Client")
+            response = self.server.SendMessage(request, DummyContext())
+            self.assertEqual(response.status, MSG_OK)
+        self.assertEqual(self.server.message_queue["user7"].qsize(), 1)
+        pending = self.server.db_manager.get_pending_messages("user7")
+        self.assertEqual([row[3] for row in pending], ["Second"])
+
+    def test_read_pool_is_read_only(self):
+        # Reads go through read-only connections, which cannot modify the database.
+        with self.assertRaises(sqlite3.OperationalError):
+            with self.server.db_manager.read_pool.connection() as conn:
+                conn.execute("DELETE FROM messages")
 
     def test_delete_account(self):
         # Insert a dummy user to be deleted.
-        with sqlite3.connect(self.server.db_manager.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)",
-                ("user_del", "hash", "user_del@example.com")
-            )
-            conn.commit()
+        self._seed_users([("user_del", "hash", "user_del@example.com")])
         request = SimpleNamespace(username="user_del", source="Client")
         context = DummyContext()
         response = self.server.DeleteAccount(request, context)
-        self.assertEqual(response.status, service_pb2.DeleteAccountResponse.DeleteAccountStatus.SUCCESS)
+        self.assertEqual(response.status, DEL_OK)
         # Verify that the user was removed from the database.
-        with sqlite3.connect(self.server.db_manager.db_name) as conn:
+        with self.conn as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE username=?", ("user_del",))
             result = cursor.fetchone()
@@ -211,13 +388,7 @@ class TestMessageServer(unittest.TestCase):
 
     def test_save_get_settings(self):
         # Insert a dummy user with default settings.
-        with sqlite3.connect(self.server.db_manager.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO users (username, password_hash, email, settings) VALUES (?, ?, ?, ?)",
-                ("user_set", "hash", "user_set@example.com", 50)
-            )
-            conn.commit()
+        self._seed_users([("user_set", "hash", "user_set@example.com")])
         # First, test GetSettings.
         request_get = SimpleNamespace(username="user_set")
         context = DummyContext()
@@ -226,11 +397,57 @@ class TestMessageServer(unittest.TestCase):
         # Then, update the settings via SaveSettings.
         request_save = SimpleNamespace(username="user_set", setting=100, source="Client")
         response_save = self.server.SaveSettings(request_save, context)
-        self.assertEqual(response_save.status, service_pb2.SaveSettingsResponse.SaveSettingsStatus.SUCCESS)
+        self.assertEqual(response_save.status, SAVE_OK)
         # Verify the updated settings.
         response_get2 = self.server.GetSettings(request_get, context)
         self.assertEqual(response_get2.setting, 100)
 
+    def test_settings_cache(self):
+        self._seed_users([("user_cache", "hash", "user_cache@example.com")])
+        db_manager = self.server.db_manager
+        self.assertEqual(db_manager.get_settings("user_cache"), 50)
+        # A second read is served from memory without touching the table.
+        with self.conn as conn:
+            conn.execute("UPDATE users SET settings = 75 WHERE username = ?", ("user_cache",))
+        self.assertEqual(db_manager.get_settings("user_cache"), 50)
+        # Saving through the manager invalidates the cached value.
+        self.assertTrue(db_manager.save_settings("user_cache", 20))
+        self.assertEqual(db_manager.get_settings("user_cache"), 20)
+
+    def test_settings_cache_save_during_read(self):
+        self._seed_users([("user_race", "hash", "user_race@example.com")])
+        db_manager = self.server.db_manager
+        read_pool = db_manager.read_pool
+
+        class SaveAfterRead:
+            """Save new settings as soon as the old ones are fetched, before get_settings can cache them."""
+            @contextmanager
+            def connection(self):
+                yield self
+
+            def execute_cached(self, sql, parameters=()):
+                with read_pool.connection() as conn:
+                    row = conn.execute_cached(sql, parameters).fetchone()
+                db_manager.save_settings("user_race", 20)
+                return SimpleNamespace(fetchone=lambda: row)
+
+        with patch.object(db_manager, "read_pool", SaveAfterRead()):
+            self.assertEqual(db_manager.get_settings("user_race"), 50)
+        # The value read before the save must not be left in the cache.
+        self.assertNotIn("user_race", db_manager.settings_cache)
+        self.assertEqual(db_manager.get_settings("user_race"), 20)
+
+    def test_settings_cache_bounded(self):
+        self._seed_users([(f"user_lru{i}", "hash", f"user_lru{i}@example.com") for i in range(3)])
+        db_manager = self.server.db_manager
+        with patch("DatabaseManager.SETTINGS_CACHE_SIZE", 2):
+            db_manager.get_settings("user_lru0")
+            db_manager.get_settings("user_lru1")
+            # Reading user_lru0 again makes user_lru1 the least recently used.
+            db_manager.get_settings("user_lru0")
+            db_manager.get_settings("user_lru2")
+        self.assertEqual(list(db_manager.settings_cache), ["user_lru0", "user_lru2"])
+
     def test_new_replica(self):
         request = SimpleNamespace(
             new_replica_id="replica1",
@@ -242,6 +459,15 @@ class TestMessageServer(unittest.TestCase):
         self.assertIn("replica1", self.server.servers)
         self.assertEqual(leader_response.id, self.server.leader["id"])
 
+    def test_peer_targets_bracket_ipv6(self):
+        # IPv6 hosts need brackets, otherwise gRPC reads the last group of the address as the port.
+        self.assertEqual(grpc_target("::1", 5001), "[::1]:5001")
+        self.assertEqual(grpc_target("127.0.0.1", "5001"), "127.0.0.1:5001")
+        self.assertEqual(grpc_target("localhost", 5001), "localhost:5001")
+        pool = PeerPool("::1", "5001")
+        self.addCleanup(pool.close)
+        self.assertEqual(pool.address, "[::1]:5001")
+
     def test_get_servers(self):
         # Populate server.servers with dummy entries.
         self.server.servers = {
@@ -250,30 +476,181 @@ class TestMessageServer(unittest.TestCase):
         }
         request = SimpleNamespace(requestor_id="server1")
         context = DummyContext()
-        responses = list(self.server.GetServers(request, context))
-        for resp in responses:
+        for resp in self.server.GetServers(request, context):
             self.assertNotEqual(resp.id, "server1")
 
+    def test_heartbeat_roster(self):
+        # A replica we know of piggybacks a server we have not seen yet.
+        self.server.servers = {
+            "server1": {"ip": "127.0.0.2", "port": "5002", "stub": None, "heartbeat": datetime.now()},
+            "server2": {"ip": "127.0.0.3", "port": "5003", "stub": None, "heartbeat": datetime.now()}
+        }
+        request = service_pb2.HeartbeatRequest(
+            requestor_id="server1",
+            server_id=self.server.server_id,
+            roster_version=1,
+            added_peers=[service_pb2.ServerInfoResponse(id="server3", ip="127.0.0.4", port="5004")]
+        )
+        context = DummyContext()
+        response = self.server.Heartbeat(request, context)
+        self.assertIn("server3", self.server.servers)
+        # Our reply announces the servers server1 has not heard about from us.
+        added = {peer.id for peer in response.added_peers}
+        self.assertEqual(added, {"server2", "server3"})
+        # Until server1 acknowledges our roster version, the same peers are offered again.
+        response = self.server.Heartbeat(request, context)
+        added = {peer.id for peer in response.added_peers}
+        self.assertEqual(added, {"server2", "server3"})
+        # Once acknowledged, they are not sent again.
+        request.acked_roster_version = response.roster_version
+        response = self.server.Heartbeat(request, context)
+        self.assertEqual(len(response.added_peers), 0)
+
+    def test_heartbeat_unknown_requestor(self):
+        # A replica that joined through another server may send us a heartbeat before we know of it.
+        self.server.servers = {
+            "server1": {"ip": "127.0.0.2", "port": "5002", "stub": None, "heartbeat": datetime.now()}
+        }
+        request = service_pb2.HeartbeatRequest(requestor_id="server9", server_id=self.server.server_id, roster_version=3)
+        response = self.server.Heartbeat(request, DummyContext())
+        self.assertIsInstance(response, service_pb2.HeartbeatResponse)
+        self.assertEqual(response.roster_version, -1)
+        self.assertEqual(len(response.added_peers), 0)
+        self.assertNotIn("server9", self.server.servers)
+        # The requestor does not treat the reply as a roster it has applied.
+        self.server.apply_roster("server1", response.roster_version, [], [])
+        self.assertNotIn("roster_version", self.server.servers["server1"])
+
+    def test_monitor_messages_probe_sends_no_roster(self):
+        # A replica checking on the leader must not look like a roster heartbeat.
+        class Leader:
+            def Heartbeat(self, request, timeout=None):
+                self.requestor_id = request.requestor_id
+                return service_pb2.HeartbeatResponse(status="Heartbeat received")
+
+            def MonitorMessages(self, request):
+                return iter(())
+
+        leader = Leader()
+        self.server.leader = {"id": "leader", "ip": "127.0.0.2", "port": "5002", "stub": leader}
+        list(self.server.MonitorMessages(SimpleNamespace(username="user_probe", source="Client"), DummyContext()))
+        self.assertEqual(leader.requestor_id, "Client")
+
+    def test_heartbeat_ring(self):
+        stale = datetime.now() - timedelta(seconds=10)
+        self.server.servers = {
+            "0-replica": {"ip": "127.0.0.2", "port": "5002", "stub": None, "heartbeat": stale},
+            "z-replica": {"ip": "127.0.0.3", "port": "5003", "stub": None, "heartbeat": stale}
+        }
+        # Servers are ordered by UUID, so our successor is the next id after ours, wrapping around.
+        self.assertEqual(self.server.ring_successor(), "z-replica")
+        self.server.server_id = "zz-replica"
+        self.assertEqual(self.server.ring_successor(), "0-replica")
+        # A recent heartbeat gossiped by a peer replaces our stale one.
+        self.server.merge_liveness({"z-replica": 100, "unknown": 0})
+        self.assertGreater(self.server.servers["z-replica"]["heartbeat"], stale)
+        self.assertEqual(self.server.servers["0-replica"]["heartbeat"], stale)
+
+    def test_heartbeat_survives_roster_changes(self):
+        server = self.server
+
+        class Arriving(dict):
+            """A server entry that registers another server while it is being read, as an RPC thread might."""
+            def __getitem__(self, key):
+                server.servers.setdefault("new-replica", {"ip": "127.0.0.4", "port": "5004", "stub": None, "heartbeat": datetime.now()})
+                return super().__getitem__(key)
+
+        server.servers = {"z-replica": Arriving(ip="127.0.0.3", port="5003", stub=None, heartbeat=datetime.now())}
+        self.assertIn("z-replica", server.liveness())
+        server.check_and_remove_failed_replicas()
+        self.assertIn("new-replica", server.servers)
+
+    @patch("MessageServer.threading.Timer")
+    def test_heartbeat_rearms_after_error(self, timer):
+        # A round that fails must still schedule the next one.
+        with patch.object(self.server, "check_and_remove_failed_replicas", side_effect=RuntimeError("boom")):
+            self.server._heartbeat()
+        timer.assert_called_once_with(1, self.server._heartbeat)
+        timer.return_value.start.assert_called_once()
+
     def test_monitor_messages(self):
         # Set up a message in the queue for a given user.
-        self.server.message_queue["user_monitor"] = []
         # Use a proto Message to simulate a pending message.
-        message = service_pb2.Message(
+        message = _Message(
             sender="user1",
             recipient="user_monitor",
             message="Hello Monitor",
-            timestamp=str(datetime.now())
+            timestamp=self.TIMESTAMP
         )
-        self.server.message_queue["user_monitor"].append(message)
+        self.server.user_queue("user_monitor").put(message)
         request = SimpleNamespace(username="user_monitor", source="Client")
         context = OneTimeActiveContext()
         gen = self.server.MonitorMessages(request, context)
         try:
-            msg = next(gen)
-            self.assertEqual(msg.message, "Hello Monitor")
+            batch = next(gen)
+            self.assertEqual([msg.message for msg in batch.messages], ["Hello Monitor"])
         except StopIteration:
             self.fail("MonitorMessages generator did not yield a message")
 
+    def test_monitor_messages_batches_burst(self):
+        # Messages that queued up while the client was busy are sent in a single batch.
+        for i in range(3):
+            self.server.user_queue("user_burst").put(_Message(sender="user1", message=f"Burst {i}"))
+        gen = self.server.MonitorMessages(SimpleNamespace(username="user_burst", source="Leader"), OneTimeActiveContext())
+        batch = next(gen)
+        self.assertEqual([msg.message for msg in batch.messages], ["Burst 0", "Burst 1", "Burst 2"])
+
+    def test_monitor_messages_cleanup(self):
+        # When a stream ends it is removed from the active clients...
+        gen = self.server.MonitorMessages(SimpleNamespace(username="user_gone", source="Leader"), OneTimeActiveContext())
+        self.server.user_queue("user_gone").put(_Message(message="Last one"))
+        self.assertEqual(next(gen).messages[0].message, "Last one")
+        self.assertEqual(list(gen), [])
+        self.assertNotIn("user_gone", self.server.active_clients)
+        # ...but an old stream closing does not evict the client's newer stream.
+        old_context, new_context = OneTimeActiveContext(), OneTimeActiveContext()
+        old_gen = self.server.MonitorMessages(SimpleNamespace(username="user_back", source="Leader"), old_context)
+        self.server.user_queue("user_back").put(_Message(message="Old"))
+        next(old_gen)
+        self.server.active_clients["user_back"] = new_context
+        old_gen.close()
+        self.assertIs(self.server.active_clients["user_back"], new_context)
+
+    def test_removed_peer_pool_closed(self):
+        class Pool:
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        stale = datetime.now() - timedelta(seconds=10)
+        quiet = datetime.now() - timedelta(seconds=2)
+        failed, reported, restarted, shared = Pool(), Pool(), Pool(), Pool()
+        self.server.servers = {
+            "server1": {"ip": "127.0.0.2", "port": "5002", "stub": failed, "heartbeat": stale},
+            "server2": {"ip": "127.0.0.3", "port": "5003", "stub": reported, "heartbeat": quiet},
+            "server3": {"ip": "127.0.0.4", "port": "5004", "stub": restarted, "heartbeat": datetime.now()},
+            "server4": {"ip": "127.0.0.5", "port": "5005", "stub": shared, "heartbeat": quiet}
+        }
+        # A server that stops sending heartbeats is dropped along with its connections.
+        self.server.check_and_remove_failed_replicas()
+        self.assertNotIn("server1", self.server.servers)
+        self.assertTrue(failed.closed)
+        # So is a server another peer reports as removed.
+        self.server.apply_roster("server3", 1, [], ["server2"])
+        self.assertNotIn("server2", self.server.servers)
+        self.assertTrue(reported.closed)
+        # A restarted replica's old connections are closed when it registers again.
+        self.server.NewReplica(service_pb2.NewReplicaRequest(new_replica_id="server3", ip="127.0.0.4", port="5004"), DummyContext())
+        self.assertTrue(restarted.closed)
+        self.server.servers["server3"]["stub"].close()
+        # A pool the leader still uses is left open.
+        self.server.leader["stub"].close()
+        self.server.leader["stub"] = shared
+        self.server.apply_roster("server3", 1, [], ["server4"])
+        self.assertNotIn("server4", self.server.servers)
+        self.assertFalse(shared.closed)
+
     def test_run_election(self):
         # Add dummy servers with fixed UUIDs.
         self.server.servers = {
@@ -286,5 +663,95 @@ class TestMessageServer(unittest.TestCase):
         expected_leader = min(["a-replica", "z-replica", self.server.server_id])
         self.assertEqual(self.server.leader["id"], expected_leader)
 
+class TestAuthHandler(unittest.TestCase):
+    """Exercise the real AuthHandler against a throwaway database."""
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # The managers name their database f"{ip}_{port}.db", so point them into the temporary directory.
+        self.ip = os.path.join(directory.name, "auth")
+        self.port = "5000"
+        self.db_file = f"{self.ip}_{self.port}.db"
+
+    def _open(self):
+        """Open the database the way a server does, returning the AuthHandler and a connection for inspection."""
+        db_manager = DatabaseManager(self.ip, self.port, pool_size=1)
+        db_manager.setup_databases(self.ip, self.port)
+        auth = AuthHandler(self.ip, self.port, pool_size=1)
+        conn = sqlite3.connect(self.db_file, isolation_level=None)
+        self.addCleanup(db_manager.close)
+        self.addCleanup(auth.close)
+        self.addCleanup(conn.close)
+        return auth, conn
+
+    def _create_legacy_database(self, rows):
+        """Create the users table as it was before salting, with a TEXT hash and text last_login, holding the given rows."""
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("""
+            CREATE TABLE users (
+                username TEXT PRIMARY KEY,
+                password_hash TEXT NOT NULL,
+                email TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_login TIMESTAMP,
+                settings INTEGER DEFAULT 50
+            )
+        """)
+        conn.executemany("INSERT INTO users (username, password_hash, email, last_login) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        conn.close()
+
+    def test_register_salted(self):
+        auth, conn = self._open()
+        self.assertEqual(auth.register_user("alice", "secret", "alice@example.com"), (True, "Success"))
+        self.assertEqual(auth.register_user("bob", "secret", "bob@example.com"), (True, "Success"))
+        rows = {row[0]: row[1:] for row in conn.execute("SELECT username, password_hash, salt FROM users")}
+        password_hash, salt = rows["alice"]
+        # The raw PBKDF2 digest is stored as a blob next to its random salt.
+        self.assertEqual(len(salt), 16)
+        self.assertEqual(password_hash, hashlib.pbkdf2_hmac('sha256', b"secret", salt, AuthHandler.HASH_ITERATIONS))
+        # The same password hashes differently for another user.
+        self.assertNotEqual(rows["bob"][0], password_hash)
+        self.assertEqual(auth.register_user("alice", "other", "alice@example.com"), (False, "Username already exists."))
+
+    def test_login(self):
+        auth, conn = self._open()
+        auth.register_user("alice", "secret", "alice@example.com")
+        before = int(time.time() * 1000)
+        self.assertEqual(auth.authenticate_user("alice", "secret"), (True, "Success"))
+        after = int(time.time() * 1000)
+        # The login is recorded as epoch milliseconds.
+        last_login, kind = conn.execute("SELECT last_login, typeof(last_login) FROM users WHERE username = 'alice'").fetchone()
+        self.assertEqual(kind, "integer")
+        self.assertTrue(before <= last_login <= after)
+
+    def test_login_failure(self):
+        auth, conn = self._open()
+        auth.register_user("alice", "secret", "alice@example.com")
+        self.assertEqual(auth.authenticate_user("alice", "wrong"), (False, "Invalid username or password"))
+        self.assertEqual(auth.authenticate_user("nobody", "secret"), (False, "Invalid username or password"))
+        # A failed login does not touch last_login.
+        self.assertIsNone(conn.execute("SELECT last_login FROM users WHERE username = 'alice'").fetchone()[0])
+
+    def test_legacy_database(self):
+        # An account created before salting, with an unsalted hex SHA-256 hash and a datetime string login.
+        legacy_hash = hashlib.sha256(b"secret").hexdigest()
+        self._create_legacy_database([("old", legacy_hash, "old@example.com", "2025-03-01 12:00:00")])
+        auth, conn = self._open()
+        # Opening the database adds the salt column and converts the old login to epoch milliseconds.
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+        self.assertIn("salt", columns)
+        salt, last_login = conn.execute("SELECT salt, last_login FROM users WHERE username = 'old'").fetchone()
+        self.assertIsNone(salt)
+        self.assertEqual(last_login, int(datetime(2025, 3, 1, 12, 0, 0).timestamp() * 1000))
+        # The legacy account still logs in, and only with its own password.
+        self.assertEqual(auth.authenticate_user("old", "wrong"), (False, "Invalid username or password"))
+        self.assertEqual(auth.authenticate_user("old", "secret"), (True, "Success"))
+        self.assertGreater(conn.execute("SELECT last_login FROM users WHERE username = 'old'").fetchone()[0], last_login)
+        # New accounts in the migrated table get salted blob hashes alongside the legacy one.
+        self.assertEqual(auth.register_user("new", "secret", "new@example.com"), (True, "Success"))
+        self.assertEqual(conn.execute("SELECT typeof(password_hash) FROM users WHERE username = 'new'").fetchone()[0], "blob")
+        self.assertEqual(auth.authenticate_user("new", "secret"), (True, "Success"))
+
 if __name__ == "__main__":
     unittest.main()
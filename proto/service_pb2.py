@@ -14,77 +14,87 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rservice.proto\x12\x0emessage_server\"E\n\x11NewReplicaRequest\x12\x16\n\x0enew_replica_id\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\t\";\n\x10HeartbeatRequest\x12\x14\n\x0crequestor_id\x18\x01 \x01(\t\x12\x11\n\tserver_id\x18\x02 \x01(\t\"9\n\x11HeartbeatResponse\x12\x14\n\x0cresponder_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\"6\n\x0eLeaderResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\t\")\n\x11GetServersRequest\x12\x14\n\x0crequestor_id\x18\x01 \x01(\t\":\n\x12ServerInfoResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\t\"T\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x0e\n\x06source\x18\x04 \x01(\t\"\x90\x01\n\x10RegisterResponse\x12?\n\x06status\x18\x01 \x01(\x0e\x32/.message_server.RegisterResponse.RegisterStatus\x12\x0f\n\x07message\x18\x02 \x01(\t\"*\n\x0eRegisterStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"B\n\x0cLoginRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\x0e\n\x06source\x18\x03 \x01(\t\"\x84\x01\n\rLoginResponse\x12\x39\n\x06status\x18\x01 \x01(\x0e\x32).message_server.LoginResponse.LoginStatus\x12\x0f\n\x07message\x18\x02 \x01(\t\"\'\n\x0bLoginStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"#\n\x0fGetUsersRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"\x91\x01\n\x10GetUsersResponse\x12?\n\x06status\x18\x01 \x01(\x0e\x32/.message_server.GetUsersResponse.GetUsersStatus\x12\x10\n\x08username\x18\x02 \x01(\t\"*\n\x0eGetUsersStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\")\n\x15MessageHistoryRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"`\n\x07Message\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x11\n\ttimestamp\x18\x04 \x01(\t\x12\x0e\n\x06source\x18\x05 \x01(\t\":\n\x16MonitorMessagesRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06source\x18\x02 \x01(\t\"{\n\x0fMessageResponse\x12=\n\x06status\x18\x01 \x01(\x0e\x32-.message_server.MessageResponse.MessageStatus\")\n\rMessageStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"N\n\x15PendingMessageRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x13\n\x0binbox_limit\x18\x02 \x01(\x05\x12\x0e\n\x06source\x18\x03 \x01(\t\"\xc1\x01\n\x16PendingMessageResponse\x12K\n\x06status\x18\x01 \x01(\x0e\x32;.message_server.PendingMessageResponse.PendingMessageStatus\x12(\n\x07message\x18\x02 \x01(\x0b\x32\x17.message_server.Message\"0\n\x14PendingMessageStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"8\n\x14\x44\x65leteAccountRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06source\x18\x02 \x01(\t\"\x93\x01\n\x15\x44\x65leteAccountResponse\x12I\n\x06status\x18\x01 \x01(\x0e\x32\x39.message_server.DeleteAccountResponse.DeleteAccountStatus\"/\n\x13\x44\x65leteAccountStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"H\n\x13SaveSettingsRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07setting\x18\x02 \x01(\x05\x12\x0e\n\x06source\x18\x03 \x01(\t\"\x8f\x01\n\x14SaveSettingsResponse\x12G\n\x06status\x18\x01 \x01(\x0e\x32\x37.message_server.SaveSettingsResponse.SaveSettingsStatus\".\n\x12SaveSettingsStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"&\n\x12GetSettingsRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"\x9c\x01\n\x13GetSettingsResponse\x12\x45\n\x06status\x18\x01 \x01(\x0e\x32\x35.message_server.GetSettingsResponse.GetSettingsStatus\x12\x0f\n\x07setting\x18\x02 \x01(\x05\"-\n\x11GetSettingsStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\x32\xdc\x08\n\rMessageServer\x12M\n\x08Register\x12\x1f.message_server.RegisterRequest\x1a .message_server.RegisterResponse\x12\x44\n\x05Login\x12\x1c.message_server.LoginRequest\x1a\x1d.message_server.LoginResponse\x12O\n\x08GetUsers\x12\x1f.message_server.GetUsersRequest\x1a .message_server.GetUsersResponse0\x01\x12U\n\x11GetMessageHistory\x12%.message_server.MessageHistoryRequest\x1a\x17.message_server.Message0\x01\x12G\n\x0bSendMessage\x12\x17.message_server.Message\x1a\x1f.message_server.MessageResponse\x12\x64\n\x11GetPendingMessage\x12%.message_server.PendingMessageRequest\x1a&.message_server.PendingMessageResponse0\x01\x12T\n\x0fMonitorMessages\x12&.message_server.MonitorMessagesRequest\x1a\x17.message_server.Message0\x01\x12\\\n\rDeleteAccount\x12$.message_server.DeleteAccountRequest\x1a%.message_server.DeleteAccountResponse\x12Y\n\x0cSaveSettings\x12#.message_server.SaveSettingsRequest\x1a$.message_server.SaveSettingsResponse\x12V\n\x0bGetSettings\x12\".message_server.GetSettingsRequest\x1a#.message_server.GetSettingsResponse\x12O\n\nNewReplica\x12!.message_server.NewReplicaRequest\x1a\x1e.message_server.LeaderResponse\x12P\n\tHeartbeat\x12 .message_server.HeartbeatRequest\x1a!.message_server.HeartbeatResponse\x12U\n\nGetServers\x12!.message_server.GetServersRequest\x1a\".message_server.ServerInfoResponse0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rservice.proto\x12\x0emessage_server\"E\n\x11NewReplicaRequest\x12\x16\n\x0enew_replica_id\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\t\"\xb4\x02\n\x10HeartbeatRequest\x12\x14\n\x0crequestor_id\x18\x01 \x01(\t\x12\x11\n\tserver_id\x18\x02 \x01(\t\x12\x16\n\x0eroster_version\x18\x03 \x01(\x03\x12\x37\n\x0b\x61\x64\x64\x65\x64_peers\x18\x04 \x03(\x0b\x32\".message_server.ServerInfoResponse\x12\x15\n\rremoved_peers\x18\x05 \x03(\t\x12@\n\x08liveness\x18\x06 \x03(\x0b\x32..message_server.HeartbeatRequest.LivenessEntry\x12\x1c\n\x14\x61\x63ked_roster_version\x18\x07 \x01(\x03\x1a/\n\rLivenessEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x03:\x02\x38\x01\"\x95\x02\n\x11HeartbeatResponse\x12\x14\n\x0cresponder_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\x16\n\x0eroster_version\x18\x03 \x01(\x03\x12\x37\n\x0b\x61\x64\x64\x65\x64_peers\x18\x04 \x03(\x0b\x32\".message_server.ServerInfoResponse\x12\x15\n\rremoved_peers\x18\x05 \x03(\t\x12\x41\n\x08liveness\x18\x06 \x03(\x0b\x32/.message_server.HeartbeatResponse.LivenessEntry\x1a/\n\rLivenessEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x03:\x02\x38\x01\"6\n\x0eLeaderResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\t\")\n\x11GetServersRequest\x12\x14\n\x0crequestor_id\x18\x01 \x01(\t\":\n\x12ServerInfoResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\t\"T\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x0e\n\x06source\x18\x04 \x01(\t\"\x90\x01\n\x10RegisterResponse\x12?\n\x06status\x18\x01 \x01(\x0e\x32/.message_server.RegisterResponse.RegisterStatus\x12\x0f\n\x07message\x18\x02 \x01(\t\"*\n\x0eRegisterStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"B\n\x0cLoginRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\x0e\n\x06source\x18\x03 \x01(\t\"\x84\x01\n\rLoginResponse\x12\x39\n\x06status\x18\x01 \x01(\x0e\x32).message_server.LoginResponse.LoginStatus\x12\x0f\n\x07message\x18\x02 \x01(\t\"\'\n\x0bLoginStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"#\n\x0fGetUsersRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"\x91\x01\n\x10GetUsersResponse\x12?\n\x06status\x18\x01 \x01(\x0e\x32/.message_server.GetUsersResponse.GetUsersStatus\x12\x10\n\x08username\x18\x02 \x01(\t\"*\n\x0eGetUsersStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"8\n\x15MessageHistoryRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\r\n\x05limit\x18\x02 \x01(\x05\"`\n\x07Message\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x11\n\ttimestamp\x18\x04 \x01(\t\x12\x0e\n\x06source\x18\x05 \x01(\t\":\n\x16MonitorMessagesRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06source\x18\x02 \x01(\t\"9\n\x0cMessageBatch\x12)\n\x08messages\x18\x01 \x03(\x0b\x32\x17.message_server.Message\"{\n\x0fMessageResponse\x12=\n\x06status\x18\x01 \x01(\x0e\x32-.message_server.MessageResponse.MessageStatus\")\n\rMessageStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"N\n\x15PendingMessageRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x13\n\x0binbox_limit\x18\x02 \x01(\x05\x12\x0e\n\x06source\x18\x03 \x01(\t\"\xec\x01\n\x16PendingMessageResponse\x12K\n\x06status\x18\x01 \x01(\x0e\x32;.message_server.PendingMessageResponse.PendingMessageStatus\x12(\n\x07message\x18\x02 \x01(\x0b\x32\x17.message_server.Message\x12)\n\x08messages\x18\x03 \x03(\x0b\x32\x17.message_server.Message\"0\n\x14PendingMessageStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"8\n\x14\x44\x65leteAccountRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06source\x18\x02 \x01(\t\"\x93\x01\n\x15\x44\x65leteAccountResponse\x12I\n\x06status\x18\x01 \x01(\x0e\x32\x39.message_server.DeleteAccountResponse.DeleteAccountStatus\"/\n\x13\x44\x65leteAccountStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"H\n\x13SaveSettingsRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07setting\x18\x02 \x01(\x05\x12\x0e\n\x06source\x18\x03 \x01(\t\"\x8f\x01\n\x14SaveSettingsResponse\x12G\n\x06status\x18\x01 \x01(\x0e\x32\x37.message_server.SaveSettingsResponse.SaveSettingsStatus\".\n\x12SaveSettingsStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\"&\n\x12GetSettingsRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"\x9c\x01\n\x13GetSettingsResponse\x12\x45\n\x06status\x18\x01 \x01(\x0e\x32\x35.message_server.GetSettingsResponse.GetSettingsStatus\x12\x0f\n\x07setting\x18\x02 \x01(\x05\"-\n\x11GetSettingsStatus\x12\x0b\n\x07SUCCESS\x10\x00\x12\x0b\n\x07\x46\x41ILURE\x10\x01\x32\xe1\x08\n\rMessageServer\x12M\n\x08Register\x12\x1f.message_server.RegisterRequest\x1a .message_server.RegisterResponse\x12\x44\n\x05Login\x12\x1c.message_server.LoginRequest\x1a\x1d.message_server.LoginResponse\x12O\n\x08GetUsers\x12\x1f.message_server.GetUsersRequest\x1a .message_server.GetUsersResponse0\x01\x12U\n\x11GetMessageHistory\x12%.message_server.MessageHistoryRequest\x1a\x17.message_server.Message0\x01\x12G\n\x0bSendMessage\x12\x17.message_server.Message\x1a\x1f.message_server.MessageResponse\x12\x64\n\x11GetPendingMessage\x12%.message_server.PendingMessageRequest\x1a&.message_server.PendingMessageResponse0\x01\x12Y\n\x0fMonitorMessages\x12&.message_server.MonitorMessagesRequest\x1a\x1c.message_server.MessageBatch0\x01\x12\\\n\rDeleteAccount\x12$.message_server.DeleteAccountRequest\x1a%.message_server.DeleteAccountResponse\x12Y\n\x0cSaveSettings\x12#.message_server.SaveSettingsRequest\x1a$.message_server.SaveSettingsResponse\x12V\n\x0bGetSettings\x12\".message_server.GetSettingsRequest\x1a#.message_server.GetSettingsResponse\x12O\n\nNewReplica\x12!.message_server.NewReplicaRequest\x1a\x1e.message_server.LeaderResponse\x12P\n\tHeartbeat\x12 .message_server.HeartbeatRequest\x1a!.message_server.HeartbeatResponse\x12U\n\nGetServers\x12!.message_server.GetServersRequest\x1a\".message_server.ServerInfoResponse0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'service_pb2', _globals)
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
+  _globals['_HEARTBEATREQUEST_LIVENESSENTRY']._options = None
+  _globals['_HEARTBEATREQUEST_LIVENESSENTRY']._serialized_options = b'8\001'
+  _globals['_HEARTBEATRESPONSE_LIVENESSENTRY']._options = None
+  _globals['_HEARTBEATRESPONSE_LIVENESSENTRY']._serialized_options = b'8\001'
   _globals['_NEWREPLICAREQUEST']._serialized_start=33
   _globals['_NEWREPLICAREQUEST']._serialized_end=102
-  _globals['_HEARTBEATREQUEST']._serialized_start=104
-  _globals['_HEARTBEATREQUEST']._serialized_end=163
-  _globals['_HEARTBEATRESPONSE']._serialized_start=165
-  _globals['_HEARTBEATRESPONSE']._serialized_end=222
-  _globals['_LEADERRESPONSE']._serialized_start=224
-  _globals['_LEADERRESPONSE']._serialized_end=278
-  _globals['_GETSERVERSREQUEST']._serialized_start=280
-  _globals['_GETSERVERSREQUEST']._serialized_end=321
-  _globals['_SERVERINFORESPONSE']._serialized_start=323
-  _globals['_SERVERINFORESPONSE']._serialized_end=381
-  _globals['_REGISTERREQUEST']._serialized_start=383
-  _globals['_REGISTERREQUEST']._serialized_end=467
-  _globals['_REGISTERRESPONSE']._serialized_start=470
-  _globals['_REGISTERRESPONSE']._serialized_end=614
-  _globals['_REGISTERRESPONSE_REGISTERSTATUS']._serialized_start=572
-  _globals['_REGISTERRESPONSE_REGISTERSTATUS']._serialized_end=614
-  _globals['_LOGINREQUEST']._serialized_start=616
-  _globals['_LOGINREQUEST']._serialized_end=682
-  _globals['_LOGINRESPONSE']._serialized_start=685
-  _globals['_LOGINRESPONSE']._serialized_end=817
-  _globals['_LOGINRESPONSE_LOGINSTATUS']._serialized_start=778
-  _globals['_LOGINRESPONSE_LOGINSTATUS']._serialized_end=817
-  _globals['_GETUSERSREQUEST']._serialized_start=819
-  _globals['_GETUSERSREQUEST']._serialized_end=854
-  _globals['_GETUSERSRESPONSE']._serialized_start=857
-  _globals['_GETUSERSRESPONSE']._serialized_end=1002
-  _globals['_GETUSERSRESPONSE_GETUSERSSTATUS']._serialized_start=960
-  _globals['_GETUSERSRESPONSE_GETUSERSSTATUS']._serialized_end=1002
-  _globals['_MESSAGEHISTORYREQUEST']._serialized_start=1004
-  _globals['_MESSAGEHISTORYREQUEST']._serialized_end=1045
-  _globals['_MESSAGE']._serialized_start=1047
-  _globals['_MESSAGE']._serialized_end=1143
-  _globals['_MONITORMESSAGESREQUEST']._serialized_start=1145
-  _globals['_MONITORMESSAGESREQUEST']._serialized_end=1203
-  _globals['_MESSAGERESPONSE']._serialized_start=1205
-  _globals['_MESSAGERESPONSE']._serialized_end=1328
-  _globals['_MESSAGERESPONSE_MESSAGESTATUS']._serialized_start=1287
-  _globals['_MESSAGERESPONSE_MESSAGESTATUS']._serialized_end=1328
-  _globals['_PENDINGMESSAGEREQUEST']._serialized_start=1330
-  _globals['_PENDINGMESSAGEREQUEST']._serialized_end=1408
-  _globals['_PENDINGMESSAGERESPONSE']._serialized_start=1411
-  _globals['_PENDINGMESSAGERESPONSE']._serialized_end=1604
-  _globals['_PENDINGMESSAGERESPONSE_PENDINGMESSAGESTATUS']._serialized_start=1556
-  _globals['_PENDINGMESSAGERESPONSE_PENDINGMESSAGESTATUS']._serialized_end=1604
-  _globals['_DELETEACCOUNTREQUEST']._serialized_start=1606
-  _globals['_DELETEACCOUNTREQUEST']._serialized_end=1662
-  _globals['_DELETEACCOUNTRESPONSE']._serialized_start=1665
-  _globals['_DELETEACCOUNTRESPONSE']._serialized_end=1812
-  _globals['_DELETEACCOUNTRESPONSE_DELETEACCOUNTSTATUS']._serialized_start=1765
-  _globals['_DELETEACCOUNTRESPONSE_DELETEACCOUNTSTATUS']._serialized_end=1812
-  _globals['_SAVESETTINGSREQUEST']._serialized_start=1814
-  _globals['_SAVESETTINGSREQUEST']._serialized_end=1886
-  _globals['_SAVESETTINGSRESPONSE']._serialized_start=1889
-  _globals['_SAVESETTINGSRESPONSE']._serialized_end=2032
-  _globals['_SAVESETTINGSRESPONSE_SAVESETTINGSSTATUS']._serialized_start=1986
-  _globals['_SAVESETTINGSRESPONSE_SAVESETTINGSSTATUS']._serialized_end=2032
-  _globals['_GETSETTINGSREQUEST']._serialized_start=2034
-  _globals['_GETSETTINGSREQUEST']._serialized_end=2072
-  _globals['_GETSETTINGSRESPONSE']._serialized_start=2075
-  _globals['_GETSETTINGSRESPONSE']._serialized_end=2231
-  _globals['_GETSETTINGSRESPONSE_GETSETTINGSSTATUS']._serialized_start=2186
-  _globals['_GETSETTINGSRESPONSE_GETSETTINGSSTATUS']._serialized_end=2231
-  _globals['_MESSAGESERVER']._serialized_start=2234
-  _globals['_MESSAGESERVER']._serialized_end=3350
+  _globals['_HEARTBEATREQUEST']._serialized_start=105
+  _globals['_HEARTBEATREQUEST']._serialized_end=413
+  _globals['_HEARTBEATREQUEST_LIVENESSENTRY']._serialized_start=366
+  _globals['_HEARTBEATREQUEST_LIVENESSENTRY']._serialized_end=413
+  _globals['_HEARTBEATRESPONSE']._serialized_start=416
+  _globals['_HEARTBEATRESPONSE']._serialized_end=693
+  _globals['_HEARTBEATRESPONSE_LIVENESSENTRY']._serialized_start=366
+  _globals['_HEARTBEATRESPONSE_LIVENESSENTRY']._serialized_end=413
+  _globals['_LEADERRESPONSE']._serialized_start=695
+  _globals['_LEADERRESPONSE']._serialized_end=749
+  _globals['_GETSERVERSREQUEST']._serialized_start=751
+  _globals['_GETSERVERSREQUEST']._serialized_end=792
+  _globals['_SERVERINFORESPONSE']._serialized_start=794
+  _globals['_SERVERINFORESPONSE']._serialized_end=852
+  _globals['_REGISTERREQUEST']._serialized_start=854
+  _globals['_REGISTERREQUEST']._serialized_end=938
+  _globals['_REGISTERRESPONSE']._serialized_start=941
+  _globals['_REGISTERRESPONSE']._serialized_end=1085
+  _globals['_REGISTERRESPONSE_REGISTERSTATUS']._serialized_start=1043
+  _globals['_REGISTERRESPONSE_REGISTERSTATUS']._serialized_end=1085
+  _globals['_LOGINREQUEST']._serialized_start=1087
+  _globals['_LOGINREQUEST']._serialized_end=1153
+  _globals['_LOGINRESPONSE']._serialized_start=1156
+  _globals['_LOGINRESPONSE']._serialized_end=1288
+  _globals['_LOGINRESPONSE_LOGINSTATUS']._serialized_start=1249
+  _globals['_LOGINRESPONSE_LOGINSTATUS']._serialized_end=1288
+  _globals['_GETUSERSREQUEST']._serialized_start=1290
+  _globals['_GETUSERSREQUEST']._serialized_end=1325
+  _globals['_GETUSERSRESPONSE']._serialized_start=1328
+  _globals['_GETUSERSRESPONSE']._serialized_end=1473
+  _globals['_GETUSERSRESPONSE_GETUSERSSTATUS']._serialized_start=1431
+  _globals['_GETUSERSRESPONSE_GETUSERSSTATUS']._serialized_end=1473
+  _globals['_MESSAGEHISTORYREQUEST']._serialized_start=1475
+  _globals['_MESSAGEHISTORYREQUEST']._serialized_end=1531
+  _globals['_MESSAGE']._serialized_start=1533
+  _globals['_MESSAGE']._serialized_end=1629
+  _globals['_MONITORMESSAGESREQUEST']._serialized_start=1631
+  _globals['_MONITORMESSAGESREQUEST']._serialized_end=1689
+  _globals['_MESSAGEBATCH']._serialized_start=1691
+  _globals['_MESSAGEBATCH']._serialized_end=1748
+  _globals['_MESSAGERESPONSE']._serialized_start=1750
+  _globals['_MESSAGERESPONSE']._serialized_end=1873
+  _globals['_MESSAGERESPONSE_MESSAGESTATUS']._serialized_start=1832
+  _globals['_MESSAGERESPONSE_MESSAGESTATUS']._serialized_end=1873
+  _globals['_PENDINGMESSAGEREQUEST']._serialized_start=1875
+  _globals['_PENDINGMESSAGEREQUEST']._serialized_end=1953
+  _globals['_PENDINGMESSAGERESPONSE']._serialized_start=1956
+  _globals['_PENDINGMESSAGERESPONSE']._serialized_end=2192
+  _globals['_PENDINGMESSAGERESPONSE_PENDINGMESSAGESTATUS']._serialized_start=2144
+  _globals['_PENDINGMESSAGERESPONSE_PENDINGMESSAGESTATUS']._serialized_end=2192
+  _globals['_DELETEACCOUNTREQUEST']._serialized_start=2194
+  _globals['_DELETEACCOUNTREQUEST']._serialized_end=2250
+  _globals['_DELETEACCOUNTRESPONSE']._serialized_start=2253
+  _globals['_DELETEACCOUNTRESPONSE']._serialized_end=2400
+  _globals['_DELETEACCOUNTRESPONSE_DELETEACCOUNTSTATUS']._serialized_start=2353
+  _globals['_DELETEACCOUNTRESPONSE_DELETEACCOUNTSTATUS']._serialized_end=2400
+  _globals['_SAVESETTINGSREQUEST']._serialized_start=2402
+  _globals['_SAVESETTINGSREQUEST']._serialized_end=2474
+  _globals['_SAVESETTINGSRESPONSE']._serialized_start=2477
+  _globals['_SAVESETTINGSRESPONSE']._serialized_end=2620
+  _globals['_SAVESETTINGSRESPONSE_SAVESETTINGSSTATUS']._serialized_start=2574
+  _globals['_SAVESETTINGSRESPONSE_SAVESETTINGSSTATUS']._serialized_end=2620
+  _globals['_GETSETTINGSREQUEST']._serialized_start=2622
+  _globals['_GETSETTINGSREQUEST']._serialized_end=2660
+  _globals['_GETSETTINGSRESPONSE']._serialized_start=2663
+  _globals['_GETSETTINGSRESPONSE']._serialized_end=2819
+  _globals['_GETSETTINGSRESPONSE_GETSETTINGSSTATUS']._serialized_start=2774
+  _globals['_GETSETTINGSRESPONSE_GETSETTINGSSTATUS']._serialized_end=2819
+  _globals['_MESSAGESERVER']._serialized_start=2822
+  _globals['_MESSAGESERVER']._serialized_end=3943
 # @@protoc_insertion_point(module_scope)
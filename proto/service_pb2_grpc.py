@@ -48,7 +48,7 @@ class MessageServerStub(object):
         self.MonitorMessages = channel.unary_stream(
                 '/message_server.MessageServer/MonitorMessages',
                 request_serializer=service__pb2.MonitorMessagesRequest.SerializeToString,
-                response_deserializer=service__pb2.Message.FromString,
+                response_deserializer=service__pb2.MessageBatch.FromString,
                 )
         self.DeleteAccount = channel.unary_unary(
                 '/message_server.MessageServer/DeleteAccount',
@@ -203,7 +203,7 @@ def add_MessageServerServicer_to_server(servicer, server):
             'MonitorMessages': grpc.unary_stream_rpc_method_handler(
                     servicer.MonitorMessages,
                     request_deserializer=service__pb2.MonitorMessagesRequest.FromString,
-                    response_serializer=service__pb2.Message.SerializeToString,
+                    response_serializer=service__pb2.MessageBatch.SerializeToString,
             ),
             'DeleteAccount': grpc.unary_unary_rpc_method_handler(
                     servicer.DeleteAccount,
@@ -361,7 +361,7 @@ class MessageServer(object):
             metadata=None):
         return grpc.experimental.unary_stream(request, target, '/message_server.MessageServer/MonitorMessages',
             service__pb2.MonitorMessagesRequest.SerializeToString,
-            service__pb2.Message.FromString,
+            service__pb2.MessageBatch.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 